@@ -0,0 +1,214 @@
+import argparse
+import time
+
+import numpy as np
+
+from chess import (ChessBoard, Pawn, Knight, Bishop, Rook, Queen, King, PIECE_SCORES, KNIGHT_TARGETS, KING_TARGETS,
+                   RAYS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, QUEEN_DIRECTIONS)
+from chess_ai import CENTER_SQUARES, UNDEVELOPED_PIECES, MATE_SCORE, ROLLOUT_PLIES, ROLLOUT_DECISIVE_SCORE
+
+# Boards are encoded as (N, 64) int8 arrays indexed by y * 8 + x: 0 for an empty square,
+# the piece code for a white piece and its negation for a black one.
+PIECE_CODES = {Pawn: 1, Knight: 2, Bishop: 3, Rook: 4, Queen: 5, King: 6}
+SQUARES = np.arange(64)
+# Material plus piece-square score of each code (offset by 6) on each square, positive for white
+SCORE_TABLE = np.zeros((13, 64), dtype=np.int32)
+for (_color, _piece_class), _scores in PIECE_SCORES.items():
+    _code = PIECE_CODES[_piece_class]
+    SCORE_TABLE[6 + (_code if _color == 'white' else -_code)] = _scores
+CENTER_INDEXES = np.array([row * 8 + col for row, col in CENTER_SQUARES])
+DEVELOPMENT_INDEXES = np.array([row * 8 + col for row, col, _, _ in UNDEVELOPED_PIECES])
+DEVELOPMENT_CODES = np.array([PIECE_CODES[piece_type] for _, _, piece_type, _ in UNDEVELOPED_PIECES], dtype=np.int8)
+DEVELOPMENT_PENALTIES = np.array([penalty for _, _, _, penalty in UNDEVELOPED_PIECES], dtype=np.int32)
+WHITE_KING_START, BLACK_KING_START = 4, 60
+PIECE_BYTES = {(color, piece_class): (code if color == 'white' else -code) & 0xFF
+               for piece_class, code in PIECE_CODES.items() for color in ('white', 'black')}
+
+# Playout moves of each piece kind from each square, as 8 rays of up to 7 target squares; a
+# target is reachable only over empty squares earlier in its ray. Kind 0 is a black pawn and
+# kind 1 a white one. Unused slots point at square 64, an extra column that stays empty.
+TARGET_SQUARES = np.full((7, 64, 8, 7), 64, dtype=np.intp)
+TARGET_MODES = np.zeros((7, 64, 8, 7), dtype=np.int8)
+MOVE_OR_CAPTURE, MOVE_ONLY, CAPTURE_ONLY = 1, 2, 3
+
+
+def _set_ray(kind, square, ray, targets, mode):
+    for step, (x, y) in enumerate(targets):
+        TARGET_SQUARES[kind, square, ray, step] = y * 8 + x
+        TARGET_MODES[kind, square, ray, step] = mode
+
+for _square in range(64):
+    _x, _y = _square % 8, _square // 8
+    for _ray, _target in enumerate(KNIGHT_TARGETS[(_x, _y)]):
+        _set_ray(2, _square, _ray, [_target], MOVE_OR_CAPTURE)
+    for _ray, _target in enumerate(KING_TARGETS[(_x, _y)]):
+        _set_ray(6, _square, _ray, [_target], MOVE_OR_CAPTURE)
+    for _kind, _directions in ((3, BISHOP_DIRECTIONS), (4, ROOK_DIRECTIONS), (5, QUEEN_DIRECTIONS)):
+        for _ray, _direction in enumerate(_directions):
+            _set_ray(_kind, _square, _ray, RAYS[(_x, _y)][_direction], MOVE_OR_CAPTURE)
+    for _kind, _step, _start_row in ((1, 1, 1), (0, -1, 6)):
+        if 0 <= _y + _step <= 7:
+            _pushes = [(_x, _y + _step)] + ([(_x, _y + 2 * _step)] if _y == _start_row else [])
+            _set_ray(_kind, _square, 0, _pushes, MOVE_ONLY)
+            for _ray, _dx in enumerate((-1, 1), 1):
+                if 0 <= _x + _dx <= 7:
+                    _set_ray(_kind, _square, _ray, [(_x + _dx, _y + _step)], CAPTURE_ONLY)
+TARGET_SQUARES = TARGET_SQUARES.reshape(7, 64, 56)
+TARGET_MODES = TARGET_MODES.reshape(7, 64, 56)
+
+
+def encode_board(board):
+    data = bytearray(64)
+    for color in ('white', 'black'):
+        for x, y in board.piece_squares[color]:
+            data[y * 8 + x] = PIECE_BYTES[color, type(board.board[y][x])]
+    return data
+
+
+def join_encoded(rows):
+    # (N, 64) array from the encode_board rows of N boards
+    return np.frombuffer(b''.join(rows), dtype=np.int8).reshape(len(rows), 64)
+
+
+def encode_boards(boards):
+    return join_encoded([encode_board(board) for board in boards])
+
+
+def evaluate_encoded(codes):
+    # Scores of encoded boards, term for term the same as ChessAI.evaluate_board
+    codes = np.asarray(codes, dtype=np.int8).reshape(-1, 64)
+    scores = SCORE_TABLE[codes + 6, SQUARES].sum(axis=1, dtype=np.int32)
+
+    # Doubled pawns: pawns per file, 10 for each beyond the first
+    files = codes.reshape(-1, 8, 8)
+    for code, sign in ((1, 1), (-1, -1)):
+        pawns = (files == code).sum(axis=1)
+        scores -= sign * 10 * np.maximum(pawns - 1, 0).sum(axis=1)
+
+    scores += 10 * np.sign(codes[:, CENTER_INDEXES]).sum(axis=1, dtype=np.int32)
+
+    scores -= 20 * (codes[:, WHITE_KING_START] != 6)
+    scores += 20 * (codes[:, BLACK_KING_START] != -6)
+
+    # Minor pieces of either colour still on a starting square
+    undeveloped = np.abs(codes[:, DEVELOPMENT_INDEXES]) == DEVELOPMENT_CODES
+    scores += (undeveloped * DEVELOPMENT_PENALTIES).sum(axis=1, dtype=np.int32)
+    return scores
+
+
+def evaluate_boards(boards):
+    return evaluate_encoded(encode_boards(boards))
+
+
+def choose_moves(boards, sides, rng):
+    # Origin and target square of a random pseudo-legal move on each (N, 65) board, -1 when the
+    # side has none. A piece is drawn first, then one of its moves; pieces without moves are
+    # dropped and drawn again.
+    count = len(boards)
+    origins = np.full(count, -1, dtype=np.intp)
+    targets = np.full(count, -1, dtype=np.intp)
+    keys = np.where(boards[:, :64] * sides[:, None] > 0, rng.random((count, 64)), -1.0)
+    pending = np.arange(count)
+    while len(pending):
+        origin = keys[pending].argmax(axis=1)
+        has_piece = keys[pending, origin] >= 0
+        pending, origin = pending[has_piece], origin[has_piece]
+        rows = np.arange(len(pending))
+        side = sides[pending]
+        code = boards[pending, origin]
+        kind = np.where(np.abs(code) == 1, side > 0, np.abs(code))
+        squares = TARGET_SQUARES[kind, origin]
+        modes = TARGET_MODES[kind, origin]
+        # Positive for our own pieces, negative for the opponent's
+        found = (boards[pending[:, None], squares] * side[:, None]).reshape(-1, 8, 7)
+        empty = found == 0
+        clear = np.ones_like(empty)
+        clear[:, :, 1:] = np.logical_and.accumulate(empty[:, :, :-1], axis=2)
+        found, empty, clear = found.reshape(-1, 56), empty.reshape(-1, 56), clear.reshape(-1, 56)
+        legal = clear & (((modes == MOVE_OR_CAPTURE) & (found <= 0)) | ((modes == MOVE_ONLY) & empty)
+                         | ((modes == CAPTURE_ONLY) & (found < 0)))
+        slot = np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+        has_move = legal[rows, slot]
+        origins[pending[has_move]] = origin[has_move]
+        targets[pending[has_move]] = squares[rows[has_move], slot[has_move]]
+        keys[pending[~has_move], origin[~has_move]] = -1.0
+        pending = pending[~has_move]
+    return origins, targets
+
+
+def random_playouts(codes, sides, max_plies=ROLLOUT_PLIES, rng=None):
+    # Plays a random game from each encoded position, all of them one ply at a time, and returns
+    # white-positive scores like ChessAI.simulate. sides is 1 where white is to move, -1 for
+    # black. Moves are pseudo-legal, so a game ends when a king is captured or a side has no
+    # move; castling and en passant are not played and pawns always promote to queens.
+    rng = rng or np.random.default_rng()
+    count = len(codes)
+    boards = np.zeros((count, 65), dtype=np.int8)
+    boards[:, :64] = codes
+    sides = np.where(np.asarray(sides) > 0, 1, -1).astype(np.int8)
+    material = SCORE_TABLE[boards[:, :64] + 6, SQUARES].sum(axis=1, dtype=np.int32)
+    scores = np.zeros(count, dtype=np.int32)
+    finished = np.zeros(count, dtype=bool)
+    live = np.flatnonzero(np.abs(material) < ROLLOUT_DECISIVE_SCORE)
+
+    for _ in range(max_plies):
+        if not len(live):
+            break
+        origins, targets = choose_moves(boards[live], sides[live], rng)
+        finished[live[origins < 0]] = True  # No moves at all: scored as a draw
+        moved = origins >= 0
+        games, origins, targets = live[moved], origins[moved], targets[moved]
+        side = sides[games]
+        piece = boards[games, origins]
+        captured = boards[games, targets]
+        promoted = (np.abs(piece) == 1) & ((targets < 8) | (targets >= 56))
+        placed = np.where(promoted, 5 * side, piece)
+        material[games] += (SCORE_TABLE[placed + 6, targets] - SCORE_TABLE[piece + 6, origins]
+                            - SCORE_TABLE[captured + 6, targets])
+        boards[games, origins] = 0
+        boards[games, targets] = placed
+        sides[games] = -side
+
+        king_taken = np.abs(captured) == 6
+        scores[games[king_taken]] = MATE_SCORE * side[king_taken].astype(np.int32)
+        finished[games[king_taken]] = True
+        live = games[~king_taken & (np.abs(material[games]) < ROLLOUT_DECISIVE_SCORE)]
+
+    unfinished = ~finished
+    scores[unfinished] = evaluate_encoded(boards[unfinished, :64])
+    return scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m batch_eval', description="Score the positions of a FEN file.")
+    parser.add_argument('fens', help="file with one FEN per line")
+    parser.add_argument('--quiet', action='store_true', help="only print the timing")
+    parser.add_argument('--playouts', type=int, default=0, help="also time this many random playouts per position")
+    args = parser.parse_args(argv)
+
+    with open(args.fens) as fen_file:
+        fens = [line.strip() for line in fen_file if line.strip()]
+    boards = [ChessBoard.from_fen(fen) for fen in fens]
+    start_time = time.perf_counter()
+    codes = encode_boards(boards)
+    encoded_time = time.perf_counter()
+    scores = evaluate_encoded(codes)
+    end_time = time.perf_counter()
+    if not args.quiet:
+        for fen, score in zip(fens, scores):
+            print(f"{score}\t{fen}")
+    print(f"Positions: {len(boards)}")
+    print(f"Encode: {encoded_time - start_time:.3f}s")
+    print(f"Evaluate: {end_time - encoded_time:.3f}s")
+    print(f"Positions per second: {len(boards) / max(end_time - start_time, 1e-9):.0f}")
+    if args.playouts:
+        sides = np.array([1 if board.turn == 'white' else -1 for board in boards])
+        start_time = time.perf_counter()
+        random_playouts(np.repeat(codes, args.playouts, axis=0), np.repeat(sides, args.playouts))
+        elapsed = time.perf_counter() - start_time
+        print(f"Playouts per second: {len(boards) * args.playouts / elapsed:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
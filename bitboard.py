@@ -0,0 +1,319 @@
+from chess import ChessBoard, Pawn, Rook, Knight, Bishop, Queen, King, PROMOTION_PIECES
+
+# Squares are numbered 0-63 as y * 8 + x, so bit 0 is a1 (white's queenside corner)
+# and bit 63 is h8, matching ChessBoard.board[y][x].
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_G = FILE_A << 6
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+NOT_FILE_AB = FULL ^ (FILE_A | FILE_B)
+NOT_FILE_GH = FULL ^ (FILE_G | FILE_H)
+RANK_3 = 0xFF << 16
+RANK_6 = 0xFF << 40
+
+PIECE_TYPES = [Pawn, Knight, Bishop, Rook, Queen, King]
+COLORS = ['white', 'black']
+
+
+def north(b):
+    return (b << 8) & FULL
+
+def south(b):
+    return b >> 8
+
+def east(b):
+    return (b << 1) & NOT_FILE_A
+
+def west(b):
+    return (b >> 1) & NOT_FILE_H
+
+def north_east(b):
+    return (b << 9) & NOT_FILE_A
+
+def north_west(b):
+    return (b << 7) & NOT_FILE_H
+
+def south_east(b):
+    return (b >> 7) & NOT_FILE_A
+
+def south_west(b):
+    return (b >> 9) & NOT_FILE_H
+
+ROOK_SHIFTS = [north, south, east, west]
+BISHOP_SHIFTS = [north_east, north_west, south_east, south_west]
+
+
+def knight_attacks(b):
+    return (((b << 17) & NOT_FILE_A) | ((b << 15) & NOT_FILE_H) |
+            ((b << 10) & NOT_FILE_AB) | ((b << 6) & NOT_FILE_GH) |
+            ((b >> 17) & NOT_FILE_H) | ((b >> 15) & NOT_FILE_A) |
+            ((b >> 10) & NOT_FILE_GH) | ((b >> 6) & NOT_FILE_AB)) & FULL
+
+def king_attacks(b):
+    row = b | east(b) | west(b)
+    return (row | north(row) | south(row)) ^ b
+
+def pawn_attacks(b, color):
+    if color == 'white':
+        return north_east(b) | north_west(b)
+    return south_east(b) | south_west(b)
+
+def slider_attacks(b, occupied, shifts):
+    attacks = 0
+    for shift in shifts:
+        ray = shift(b)
+        while ray:
+            attacks |= ray
+            if ray & occupied:
+                break
+            ray = shift(ray)
+    return attacks
+
+KNIGHT_ATTACKS = [knight_attacks(1 << sq) for sq in range(64)]
+KING_ATTACKS = [king_attacks(1 << sq) for sq in range(64)]
+PAWN_ATTACKS = {color: [pawn_attacks(1 << sq, color) for sq in range(64)] for color in COLORS}
+
+
+def square_index(square):
+    x, y = square
+    return y * 8 + x
+
+def index_square(sq):
+    return (sq & 7, sq >> 3)
+
+def iter_bits(b):
+    while b:
+        low = b & -b
+        yield low.bit_length() - 1
+        b ^= low
+
+
+class BitBoard:
+    def __init__(self):
+        self.pieces = {color: {piece_type: 0 for piece_type in PIECE_TYPES} for color in COLORS}
+        self.occupancy = {'white': 0, 'black': 0}
+        self.occupied = 0
+        self.unmoved = 0  # Mirrors ChessPiece.has_moved, used for castling rights
+        self.last_move = None
+        self.turn = 'white'
+
+    @classmethod
+    def from_chessboard(cls, board):
+        bitboard = cls()
+        for y in range(8):
+            for x in range(8):
+                piece = board.board[y][x]
+                if piece != ' ':
+                    bit = 1 << (y * 8 + x)
+                    bitboard.pieces[piece.color][type(piece)] |= bit
+                    bitboard.occupancy[piece.color] |= bit
+                    if not piece.has_moved:
+                        bitboard.unmoved |= bit
+        bitboard.occupied = bitboard.occupancy['white'] | bitboard.occupancy['black']
+        bitboard.last_move = board.last_move
+        bitboard.turn = board.turn
+        return bitboard
+
+    def to_chessboard(self):
+        board = ChessBoard(setup=False)
+        for color in COLORS:
+            for piece_type in PIECE_TYPES:
+                for sq in iter_bits(self.pieces[color][piece_type]):
+                    x, y = index_square(sq)
+                    piece = piece_type(color)
+                    piece.has_moved = not self.unmoved & (1 << sq)
+                    board.board[y][x] = piece
+        board.last_move = self.last_move
+        board.turn = self.turn
+        board.sync_state()
+        board.is_in_check['white'] = self.is_king_in_check('white')
+        board.is_in_check['black'] = self.is_king_in_check('black')
+        return board
+
+    def piece_at(self, sq):
+        bit = 1 << sq
+        if not self.occupied & bit:
+            return None
+        color = 'white' if self.occupancy['white'] & bit else 'black'
+        for piece_type in PIECE_TYPES:
+            if self.pieces[color][piece_type] & bit:
+                return color, piece_type
+        return None
+
+    def attackers_of(self, sq, color):
+        # Bitboard of `color` pieces attacking square `sq`
+        opponent_color = 'black' if color == 'white' else 'white'
+        pieces = self.pieces[color]
+        attackers = KNIGHT_ATTACKS[sq] & pieces[Knight]
+        attackers |= KING_ATTACKS[sq] & pieces[King]
+        # A pawn of `color` attacks sq if sq's opposite-colored pawn attacks would reach it
+        attackers |= PAWN_ATTACKS[opponent_color][sq] & pieces[Pawn]
+        bit = 1 << sq
+        attackers |= slider_attacks(bit, self.occupied, ROOK_SHIFTS) & (pieces[Rook] | pieces[Queen])
+        attackers |= slider_attacks(bit, self.occupied, BISHOP_SHIFTS) & (pieces[Bishop] | pieces[Queen])
+        return attackers
+
+    def is_square_under_attack(self, square, color):
+        if not isinstance(square, tuple) or len(square) != 2:
+            return False
+        opponent_color = 'black' if color == 'white' else 'white'
+        return self.attackers_of(square_index(square), opponent_color) != 0
+
+    def is_king_in_check(self, color):
+        king = self.pieces[color][King]
+        if not king:
+            return False
+        opponent_color = 'black' if color == 'white' else 'white'
+        return self.attackers_of(king.bit_length() - 1, opponent_color) != 0
+
+    def en_passant_target(self, color):
+        if not self.last_move:
+            return None
+        x1, y1, x2, y2 = self.last_move
+        if abs(y2 - y1) != 2:
+            return None
+        opponent_color = 'black' if color == 'white' else 'white'
+        if not self.pieces[opponent_color][Pawn] & (1 << (y2 * 8 + x2)):
+            return None
+        return ((y1 + y2) // 2) * 8 + x2
+
+    def pseudo_legal_moves(self, color):
+        opponent_color = 'black' if color == 'white' else 'white'
+        own = self.occupancy[color]
+        enemy = self.occupancy[opponent_color]
+        empty = FULL ^ self.occupied
+        pieces = self.pieces[color]
+
+        # Pawns
+        en_passant = self.en_passant_target(color)
+        capturable = enemy | (1 << en_passant if en_passant is not None else 0)
+        for sq in iter_bits(pieces[Pawn]):
+            bit = 1 << sq
+            if color == 'white':
+                single = north(bit) & empty
+                double = north(single & RANK_3) & empty
+            else:
+                single = south(bit) & empty
+                double = south(single & RANK_6) & empty
+            targets = single | double | (PAWN_ATTACKS[color][sq] & capturable)
+            for target in iter_bits(targets):
+                if (target >> 3) in (0, 7):
+                    for piece_type in PROMOTION_PIECES:
+                        yield sq, target, piece_type
+                else:
+                    yield sq, target
+
+        for sq in iter_bits(pieces[Knight]):
+            for target in iter_bits(KNIGHT_ATTACKS[sq] & ~own):
+                yield sq, target
+
+        for piece_type, shifts in ((Bishop, BISHOP_SHIFTS), (Rook, ROOK_SHIFTS), (Queen, ROOK_SHIFTS + BISHOP_SHIFTS)):
+            for sq in iter_bits(pieces[piece_type]):
+                for target in iter_bits(slider_attacks(1 << sq, self.occupied, shifts) & ~own):
+                    yield sq, target
+
+        for sq in iter_bits(pieces[King]):
+            for target in iter_bits(KING_ATTACKS[sq] & ~own):
+                yield sq, target
+
+            # Castling: king and rook unmoved, squares between empty, king never crosses an attacked square
+            home = 4 if color == 'white' else 60
+            if sq == home and self.unmoved & (1 << sq):
+                for rook_sq, between, path in ((home + 3, (home + 1, home + 2), (home, home + 1, home + 2)),
+                                               (home - 4, (home - 1, home - 2, home - 3), (home, home - 1, home - 2))):
+                    if not pieces[Rook] & self.unmoved & (1 << rook_sq):
+                        continue
+                    if any(self.occupied & (1 << s) for s in between):
+                        continue
+                    if any(self.attackers_of(s, opponent_color) for s in path):
+                        continue
+                    yield sq, path[2]
+
+    def apply_move(self, start_sq, end_sq, promotion=None):
+        # Makes the move without legality checks and returns the state needed to restore it
+        state = (
+            {color: dict(self.pieces[color]) for color in COLORS},
+            dict(self.occupancy), self.occupied, self.unmoved, self.last_move, self.turn
+        )
+        color, piece_type = self.piece_at(start_sq)
+        opponent_color = 'black' if color == 'white' else 'white'
+        start_bit = 1 << start_sq
+        end_bit = 1 << end_sq
+
+        captured = self.piece_at(end_sq)
+        if captured:
+            self.pieces[opponent_color][captured[1]] ^= end_bit
+            self.occupancy[opponent_color] ^= end_bit
+        elif piece_type is Pawn and (start_sq - end_sq) % 8:
+            # En passant: the captured pawn sits beside the start square
+            victim_bit = 1 << ((start_sq & ~7) | (end_sq & 7))
+            self.pieces[opponent_color][Pawn] ^= victim_bit
+            self.occupancy[opponent_color] ^= victim_bit
+
+        self.pieces[color][piece_type] ^= start_bit | end_bit
+        self.occupancy[color] ^= start_bit | end_bit
+
+        if piece_type is Pawn and (end_sq >> 3) in (0, 7):
+            self.pieces[color][Pawn] ^= end_bit
+            self.pieces[color][promotion or Queen] |= end_bit
+
+        if piece_type is King and abs(end_sq - start_sq) == 2:
+            if end_sq > start_sq:
+                rook_start, rook_end = start_sq + 3, start_sq + 1
+            else:
+                rook_start, rook_end = start_sq - 4, start_sq - 1
+            rook_bits = (1 << rook_start) | (1 << rook_end)
+            self.pieces[color][Rook] ^= rook_bits
+            self.occupancy[color] ^= rook_bits
+            self.unmoved &= ~(1 << rook_start)
+
+        self.occupied = self.occupancy['white'] | self.occupancy['black']
+        self.unmoved &= ~(start_bit | end_bit)
+        self.last_move = index_square(start_sq) + index_square(end_sq)
+        self.turn = opponent_color
+        return state
+
+    def restore(self, state):
+        self.pieces, self.occupancy, self.occupied, self.unmoved, self.last_move, self.turn = state
+
+    def iter_legal_moves(self, color):
+        for move in list(self.pseudo_legal_moves(color)):
+            state = self.apply_move(*move)
+            in_check = self.is_king_in_check(color)
+            self.restore(state)
+            if not in_check:
+                yield (index_square(move[0]), index_square(move[1])) + move[2:]
+
+    def legal_moves(self, color):
+        return list(self.iter_legal_moves(color))
+
+    def has_legal_moves(self, color):
+        return next(self.iter_legal_moves(color), None) is not None
+
+    def move_piece(self, start, end, check_only=False, promotion=None):
+        start_sq = square_index(start)
+        end_sq = square_index(end)
+        piece = self.piece_at(start_sq)
+        if piece is None:
+            return False
+        color = piece[0]
+
+        if not any(move[:2] == (start_sq, end_sq) for move in self.pseudo_legal_moves(color)):
+            return False
+
+        state = self.apply_move(start_sq, end_sq, promotion)
+        legal = not self.is_king_in_check(color)
+        if not legal or check_only:
+            self.restore(state)
+        return legal
+
+    def get_game_state(self, current_player):
+        in_check = self.is_king_in_check(current_player)
+        if not self.has_legal_moves(current_player):
+            return 'checkmate' if in_check else 'stalemate'
+        if in_check:
+            return 'check'
+        return 'ongoing'
@@ -0,0 +1,162 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+from chess import ChessBoard, Knight, Bishop, Rook, Queen, King, STARTING_FEN, move_to_uci
+from pgn import read_games, replay
+
+# Polyglot layout: 16-byte big-endian entries (key, move, weight, learn) sorted by key.
+# The keys are ChessBoard.zobrist_key values, not Polyglot's Random64 hashes, so books
+# share the file format with Polyglot tools but have to be built with build_book.
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+PROMOTION_CODES = {Knight: 1, Bishop: 2, Rook: 3, Queen: 4}
+PROMOTION_CLASSES = {code: piece_class for piece_class, code in PROMOTION_CODES.items()}
+BOOK_PLIES = 20  # Moves past this ply are not added to a book
+MAX_WEIGHT = 0xFFFF
+
+
+def encode_move(move, board):
+    # to file, to row, from file, from row and promotion piece in 3 bits each.
+    # Castling is stored as the king taking its own rook, as Polyglot does.
+    (x1, y1), (x2, y2) = move[0], move[1]
+    if isinstance(board.board[y1][x1], King) and abs(x2 - x1) == 2:
+        x2 = 7 if x2 > x1 else 0
+    promotion = PROMOTION_CODES[move[2]] if len(move) > 2 else 0
+    return (promotion << 12) | (y1 << 9) | (x1 << 6) | (y2 << 3) | x2
+
+
+def decode_move(code, board):
+    x2, y2 = code & 7, (code >> 3) & 7
+    x1, y1 = (code >> 6) & 7, (code >> 9) & 7
+    promotion = PROMOTION_CLASSES.get((code >> 12) & 7)
+    if promotion:
+        return ((x1, y1), (x2, y2), promotion)
+    if isinstance(board.board[y1][x1], King) and abs(x2 - x1) > 1:
+        return ((x1, y1), (6 if x2 > x1 else 2, y1))
+    return ((x1, y1), (x2, y2))
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY.size
+        # mmap refuses empty files; an empty book simply has no entries
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+    def key_at(self, index):
+        return KEY.unpack_from(self.data, index * ENTRY.size)[0]
+
+    def lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        # (move code, weight) pairs stored for a position hash
+        index = self.lower_bound(key)
+        while index < self.count:
+            entry_key, code, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            yield code, weight
+            index += 1
+
+    def moves(self, board):
+        # Book moves of the position with their weights, skipping any that are not legal here
+        found = []
+        for code, weight in self.entries(board.zobrist_key):
+            move = decode_move(code, board)
+            piece = board.board[move[0][1]][move[0][0]]
+            if piece != ' ' and piece.color == board.turn and board.is_valid_move(move[0], move[1]):
+                found.append((move, weight))
+        return found
+
+    def choose_move(self, board, weighted=True, rng=random):
+        # A random move in proportion to its weight, or the heaviest one
+        moves = [(move, weight) for move, weight in self.moves(board) if weight > 0]
+        if not moves:
+            return None
+        if not weighted:
+            return max(moves, key=lambda item: item[1])[0]
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+
+def build_book(pgn_paths, output_path, max_plies=BOOK_PLIES, min_games=1):
+    # Weights count 2 for each win and 1 for each draw of the side that played the move
+    weights = {}
+    games = {}
+    game_count = 0
+    for path in pgn_paths:
+        for tags, san_moves, result in read_games(path):
+            game_count += 1
+            for ply, (board, move) in enumerate(replay(tags, san_moves)):
+                if ply >= max_plies:
+                    break
+                key = (board.zobrist_key, encode_move(move, board))
+                winner = {'1-0': 'white', '0-1': 'black'}.get(result)
+                points = 1 if winner is None else 2 if winner == board.turn else 0
+                weights[key] = weights.get(key, 0) + points
+                games[key] = games.get(key, 0) + 1
+
+    entries = sorted((key, code, min(weights[key, code], MAX_WEIGHT))
+                     for key, code in weights if games[key, code] >= min_games)
+    with open(output_path, 'wb') as book_file:
+        for key, code, weight in entries:
+            book_file.write(ENTRY.pack(key, code, weight, 0))
+    return game_count, len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m book', description="Build or query an opening book.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="create a book from PGN files")
+    build_parser.add_argument('pgn', nargs='+')
+    build_parser.add_argument('--output', default='book.bin')
+    build_parser.add_argument('--max-plies', type=int, default=BOOK_PLIES)
+    build_parser.add_argument('--min-games', type=int, default=1, help="drop moves played in fewer games")
+
+    probe_parser = subparsers.add_parser('probe', help="list the book moves of a position")
+    probe_parser.add_argument('--book', default='book.bin')
+    probe_parser.add_argument('--fen', default=STARTING_FEN)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start_time = time.perf_counter()
+        game_count, entry_count = build_book(args.pgn, args.output, args.max_plies, args.min_games)
+        elapsed = time.perf_counter() - start_time
+        print(f"Games: {game_count}")
+        print(f"Entries: {entry_count}")
+        print(f"Time: {elapsed:.3f}s")
+    elif args.command == 'probe':
+        book = OpeningBook(args.book)
+        board = ChessBoard.from_fen(args.fen)
+        start_time = time.perf_counter()
+        moves = book.moves(board)
+        elapsed = time.perf_counter() - start_time
+        for move, weight in sorted(moves, key=lambda item: -item[1]):
+            print(f"{move_to_uci(move)}: {weight}")
+        print(f"Lookup: {elapsed * 1e6:.0f}us")
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,43 @@
+import argparse
 import asyncio
+import random
+import time
+
+KNIGHT_OFFSETS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_OFFSETS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+SQUARES = [(x, y) for y in range(8) for x in range(8)]
+
+def _targets(square, offsets):
+    x, y = square
+    return [(x + dx, y + dy) for dx, dy in offsets if 0 <= x + dx < 8 and 0 <= y + dy < 8]
+
+def _ray(square, direction):
+    (x, y), (dx, dy) = square, direction
+    ray = []
+    x, y = x + dx, y + dy
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray.append((x, y))
+        x, y = x + dx, y + dy
+    return ray
+
+# Attack tables, built once at import time
+KNIGHT_TARGETS = {square: _targets(square, KNIGHT_OFFSETS) for square in SQUARES}
+KING_TARGETS = {square: _targets(square, KING_OFFSETS) for square in SQUARES}
+PAWN_ATTACKS = {
+    'white': {square: _targets(square, [(-1, 1), (1, 1)]) for square in SQUARES},
+    'black': {square: _targets(square, [(-1, -1), (1, -1)]) for square in SQUARES},
+}
+# Squares along each direction from a square, nearest first
+RAYS = {square: {direction: _ray(square, direction) for direction in QUEEN_DIRECTIONS}
+        for square in SQUARES}
+# Direction leading from one square to another along a rank, file or diagonal
+RAY_DIRECTIONS = {(square, target): direction
+                  for square in SQUARES
+                  for direction, ray in RAYS[square].items()
+                  for target in ray}
 
 class ChessPiece:
     def __init__(self, color):
@@ -20,6 +59,44 @@ class ChessPiece:
             return False
         return True
 
+    def copy(self):
+        piece = type(self)(self.color)
+        piece.has_moved = self.has_moved
+        return piece
+
+    def generate_moves(self, board, square):
+        # Pseudo-legal moves; ChessBoard.legal_moves filters out the ones leaving the king in check
+        return iter(())
+
+    def jump_moves(self, board, square, targets):
+        for x2, y2 in targets[square]:
+            target = board.board[y2][x2]
+            if target == ' ' or target.color != self.color:
+                yield square, (x2, y2)
+
+    def slide_moves(self, board, square, directions):
+        rays = RAYS[square]
+        for direction in directions:
+            for x2, y2 in rays[direction]:
+                target = board.board[y2][x2]
+                if target == ' ':
+                    yield square, (x2, y2)
+                else:
+                    if target.color != self.color:
+                        yield square, (x2, y2)
+                    break
+
+    def is_path_clear(self, board, start, end, directions):
+        direction = RAY_DIRECTIONS.get((start, end))
+        if direction not in directions:
+            return False
+        for x, y in RAYS[start][direction]:
+            if (x, y) == end:
+                return True
+            if board.board[y][x] != ' ':
+                return False
+        return False
+
     def __str__(self):
         return f"{self.color} {self.__class__.__name__}"
 
@@ -45,11 +122,11 @@ class Pawn(ChessPiece):
             return True
         
         # Capture
-        if abs(x2 - x1) == 1 and y2 == y1 + direction and isinstance(board.board[y2][x2], ChessPiece) and board.board[y2][x2].color != self.color:
+        if end in PAWN_ATTACKS[self.color][start] and isinstance(board.board[y2][x2], ChessPiece) and board.board[y2][x2].color != self.color:
             return True
         
         # En passant
-        if abs(x2 - x1) == 1 and y2 == y1 + direction and board.board[y2][x2] == ' ':
+        if end in PAWN_ATTACKS[self.color][start] and board.board[y2][x2] == ' ':
             if board.last_move:
                 last_start_x, last_start_y, last_end_x, last_end_y = board.last_move
                 if (last_end_x == x2 and last_end_y == y1 and
@@ -60,72 +137,84 @@ class Pawn(ChessPiece):
 
         return False
 
+    def generate_moves(self, board, square):
+        x1, y1 = square
+        if self.color == 'white':
+            direction = 1
+            start_row = 1
+        else:
+            direction = -1
+            start_row = 6
+
+        y2 = y1 + direction
+        if not 0 <= y2 < 8:
+            return
+
+        # Pushes
+        if board.board[y2][x1] == ' ':
+            if y2 in (0, 7):
+                for piece_class in PROMOTION_PIECES:
+                    yield square, (x1, y2), piece_class
+            else:
+                yield square, (x1, y2)
+                if y1 == start_row and board.board[y2 + direction][x1] == ' ':
+                    yield square, (x1, y2 + direction)
+
+        # Captures and en passant
+        for x2, y2 in PAWN_ATTACKS[self.color][square]:
+            target = board.board[y2][x2]
+            if target != ' ':
+                if target.color != self.color:
+                    if y2 in (0, 7):
+                        for piece_class in PROMOTION_PIECES:
+                            yield square, (x2, y2), piece_class
+                    else:
+                        yield square, (x2, y2)
+            elif board.last_move:
+                last_start_x, last_start_y, last_end_x, last_end_y = board.last_move
+                if (last_end_x == x2 and last_end_y == y1 and
+                    isinstance(board.board[y1][x2], Pawn) and
+                    board.board[y1][x2].color != self.color and
+                    abs(last_start_y - last_end_y) == 2):
+                    yield square, (x2, y2)
+
 class Rook(ChessPiece):
     def is_valid_move(self, board, start, end):
         if not super().is_valid_move(board, start, end):
             return False
-        x1, y1 = start
-        x2, y2 = end
-        if x1 != x2 and y1 != y2:
-            return False
-        step_x = 0 if x1 == x2 else (1 if x2 > x1 else -1)
-        step_y = 0 if y1 == y2 else (1 if y2 > y1 else -1)
-        x, y = x1 + step_x, y1 + step_y
-        while (x, y) != (x2, y2):
-            if board.board[y][x] != ' ':
-                return False
-            x, y = x + step_x, y + step_y
-        return True
+        return self.is_path_clear(board, start, end, ROOK_DIRECTIONS)
+
+    def generate_moves(self, board, square):
+        return self.slide_moves(board, square, ROOK_DIRECTIONS)
 
 class Knight(ChessPiece):
     def is_valid_move(self, board, start, end):
         if not super().is_valid_move(board, start, end):
             return False
-        x1, y1 = start
-        x2, y2 = end
-        return (abs(x2 - x1) == 2 and abs(y2 - y1) == 1) or (abs(x2 - x1) == 1 and abs(y2 - y1) == 2)
+        return end in KNIGHT_TARGETS[start]
+
+    def generate_moves(self, board, square):
+        return self.jump_moves(board, square, KNIGHT_TARGETS)
 
 class Bishop(ChessPiece):
     def is_valid_move(self, board, start, end):
         if not super().is_valid_move(board, start, end):
             return False
-        x1, y1 = start
-        x2, y2 = end
-        if abs(x2 - x1) != abs(y2 - y1):
-            return False
-        step_x = 1 if x2 > x1 else -1
-        step_y = 1 if y2 > y1 else -1
-        x, y = x1 + step_x, y1 + step_y
-        while (x, y) != (x2, y2):
-            if board.board[y][x] != ' ':
-                return False
-            x, y = x + step_x, y + step_y
-        return True
+        return self.is_path_clear(board, start, end, BISHOP_DIRECTIONS)
+
+    def generate_moves(self, board, square):
+        return self.slide_moves(board, square, BISHOP_DIRECTIONS)
 
 class Queen(ChessPiece):
     def is_valid_move(self, board, start, end):
         if not super().is_valid_move(board, start, end):
             return False
         
-        x1, y1 = start
-        x2, y2 = end
-        
-        # Check if the move is along a rank, file, or diagonal
-        if x1 == x2 or y1 == y2 or abs(x2 - x1) == abs(y2 - y1):
-            # Determine the direction of movement
-            dx = 0 if x2 == x1 else (1 if x2 > x1 else -1)
-            dy = 0 if y2 == y1 else (1 if y2 > y1 else -1)
-            
-            # Check if the path is clear
-            x, y = x1 + dx, y1 + dy
-            while (x, y) != (x2, y2):
-                if board.board[y][x] != ' ':
-                    return False
-                x, y = x + dx, y + dy
-            
-            return True
-        
-        return False
+        # Check if the move is along a rank, file, or diagonal with a clear path
+        return self.is_path_clear(board, start, end, QUEEN_DIRECTIONS)
+
+    def generate_moves(self, board, square):
+        return self.slide_moves(board, square, QUEEN_DIRECTIONS)
 
 class King(ChessPiece):
     def is_valid_move(self, board, start, end):
@@ -136,7 +225,7 @@ class King(ChessPiece):
         x2, y2 = end
 
         # Normal king move
-        if abs(x2 - x1) <= 1 and abs(y2 - y1) <= 1:
+        if end in KING_TARGETS[start]:
             return super().is_valid_move(board, start, end)
 
         # Castling
@@ -170,15 +259,358 @@ class King(ChessPiece):
 
         return False
 
+    def generate_moves(self, board, square):
+        yield from self.jump_moves(board, square, KING_TARGETS)
+
+        # Castling
+        home = (4, 0) if self.color == 'white' else (4, 7)
+        if not self.has_moved and square == home:
+            x1, y1 = square
+            for x2 in (x1 + 2, x1 - 2):
+                if self.is_valid_move(board, square, (x2, y1)):
+                    yield square, (x2, y1)
+
+PROMOTION_PIECES = [Queen, Rook, Bishop, Knight]
+
+# Zobrist keys, seeded so that hashes are stable across runs and processes
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = {
+    (color, piece_class): [_zobrist_random.getrandbits(64) for _ in range(64)]
+    for color in ('white', 'black')
+    for piece_class in (Pawn, Knight, Bishop, Rook, Queen, King)
+}
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+PIECE_VALUES = {Pawn: 100, Knight: 320, Bishop: 330, Rook: 500, Queen: 900, King: 20000}
+
+# Piece square tables for positional scoring, written from white's side with rank 8 first
+PIECE_SQUARE_TABLES = {
+    Pawn: [
+        0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5,  5, 10, 25, 25, 10,  5,  5,
+        0,  0,  0, 20, 20,  0,  0,  0,
+        5, -5,-10,  0,  0,-10, -5,  5,
+        5, 10, 10,-20,-20, 10, 10,  5,
+        0,  0,  0,  0,  0,  0,  0,  0
+    ],
+    Knight: [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50,
+    ],
+    Bishop: [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20,
+    ],
+    Rook: [
+        0,  0,  0,  0,  0,  0,  0,  0,
+        5, 10, 10, 10, 10, 10, 10,  5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        0,  0,  0,  5,  5,  0,  0,  0
+    ],
+    Queen: [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+        -5,  0,  5,  5,  5,  5,  0, -5,
+        0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20
+    ],
+    King: [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+        20, 20,  0,  0,  0,  0, 20, 20,
+        20, 30, 10,  0,  0, 10, 30, 20
+    ]
+}
+
+
+def _piece_scores(color, piece_class):
+    table = PIECE_SQUARE_TABLES[piece_class]
+    sign = 1 if color == 'white' else -1
+    scores = []
+    for y in range(8):
+        row = 7 - y if color == 'white' else y
+        for x in range(8):
+            scores.append(sign * (PIECE_VALUES[piece_class] + table[row * 8 + x]))
+    return scores
+
+# Material plus piece-square score of a piece on each square (y * 8 + x), positive for white
+PIECE_SCORES = {
+    (color, piece_class): _piece_scores(color, piece_class)
+    for color in ('white', 'black')
+    for piece_class in (Pawn, Knight, Bishop, Rook, Queen, King)
+}
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+
+# Packed positions: a nibble per square (y * 8 + x, low nibble first) holding 1-6 for a white
+# pawn to king and 9-14 for a black one, then a byte with black to move in bit 0 and the
+# castling rights above it, then the en passant file or 0xFF
+PACKED_SIZE = 34
+PACKED_CODES = {(color, piece_class): code + (8 if color == 'black' else 0)
+                for code, piece_class in enumerate((Pawn, Knight, Bishop, Rook, Queen, King), 1)
+                for color in ('white', 'black')}
+PACKED_PIECES = {code: key for key, code in PACKED_CODES.items()}
+NO_EN_PASSANT = 0xFF
+CASTLING_ROOKS = ((WHITE_KINGSIDE, 7, 0), (WHITE_QUEENSIDE, 0, 0), (BLACK_KINGSIDE, 7, 7), (BLACK_QUEENSIDE, 0, 7))
+
+def square_name(square):
+    x, y = square
+    return 'abcdefgh'[x] + str(y + 1)
+
+def parse_square(name):
+    return (ord(name[0]) - ord('a'), int(name[1]) - 1)
+
+def move_to_uci(move):
+    uci = square_name(move[0]) + square_name(move[1])
+    if len(move) > 2 and move[2] is not None:
+        uci += next(symbol for symbol, piece_class in FEN_PIECES.items() if piece_class is move[2])
+    return uci
+
+class UndoRecord:
+    __slots__ = ('move', 'piece', 'piece_had_moved', 'captured', 'captured_square',
+                 'rook', 'rook_start', 'rook_end', 'rook_had_moved', 'promoted', 'last_move',
+                 'castling', 'en_passant_file', 'zobrist_key', 'material_score', 'halfmove_clock')
+
+    def __init__(self, move, piece, piece_had_moved, captured, captured_square, last_move):
+        self.move = move
+        self.piece = piece
+        self.piece_had_moved = piece_had_moved
+        self.captured = captured
+        self.captured_square = captured_square
+        self.rook = None
+        self.rook_start = None
+        self.rook_end = None
+        self.rook_had_moved = False
+        self.promoted = None
+        self.last_move = last_move
+        self.castling = 0
+        self.en_passant_file = None
+        self.zobrist_key = 0
+        self.material_score = 0
+        self.halfmove_clock = 0
+
 class ChessBoard:
-    def __init__(self):
+    def __init__(self, setup=True):
         self.board = [[' ' for _ in range(8)] for _ in range(8)]
-        self.setup_pieces()
+        if setup:
+            self.setup_pieces()
         self.move_history = []
         self.last_move = None
         self.captured_pieces = {'white': [], 'black': []}
         self.check_task = None
         self.is_in_check = {'white': False, 'black': False}
+        self.turn = 'white'
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.sync_state()
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        placement, turn, castling, en_passant = fields[:4]
+
+        board = cls(setup=False)
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"Invalid FEN placement: {placement!r}")
+        for rank_index, rank in enumerate(ranks):
+            y = 7 - rank_index
+            x = 0
+            for char in rank:
+                if char.isdigit():
+                    x += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or x > 7:
+                    raise ValueError(f"Invalid FEN placement: {placement!r}")
+                piece = FEN_PIECES[char.lower()]('white' if char.isupper() else 'black')
+                # Only pawns on their starting rank and castling pieces count as unmoved
+                piece.has_moved = not (isinstance(piece, Pawn) and y == (1 if piece.color == 'white' else 6))
+                board.board[y][x] = piece
+                x += 1
+            if x != 8:
+                raise ValueError(f"Invalid FEN placement: {placement!r}")
+
+        if turn not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN side to move: {turn!r}")
+        board.turn = 'white' if turn == 'w' else 'black'
+
+        for right, (x, y) in (('K', (7, 0)), ('Q', (0, 0)), ('k', (7, 7)), ('q', (0, 7))):
+            if right in castling:
+                king = board.board[y][4]
+                rook = board.board[y][x]
+                if isinstance(king, King) and isinstance(rook, Rook):
+                    king.has_moved = False
+                    rook.has_moved = False
+
+        if en_passant != '-':
+            x, y = parse_square(en_passant)
+            # Recreate the double pawn push that allows the capture
+            if y == 2:
+                board.last_move = (x, 1, x, 3)
+            elif y == 5:
+                board.last_move = (x, 6, x, 4)
+
+        # The move counters are optional; some writers number the first move 0
+        counters = fields[4:6]
+        if not all(counter.isdigit() for counter in counters):
+            raise ValueError(f"Invalid FEN move counters: {' '.join(counters)!r}")
+        board.halfmove_clock = int(counters[0]) if counters else 0
+        board.fullmove_number = max(1, int(counters[1])) if len(counters) > 1 else 1
+
+        board.sync_state()
+        board.is_in_check['white'] = board.is_king_in_check('white')
+        board.is_in_check['black'] = board.is_king_in_check('black')
+        return board
+
+    @classmethod
+    def unpack(cls, data, offset=0):
+        # Board from PACKED_SIZE bytes of `data` at `offset`, as written by pack()
+        board = cls(setup=False)
+        for i in range(32):
+            byte = data[offset + i]
+            for square, code in ((2 * i, byte & 15), (2 * i + 1, byte >> 4)):
+                if code:
+                    color, piece_class = PACKED_PIECES[code]
+                    x, y = square % 8, square // 8
+                    piece = piece_class(color)
+                    piece.has_moved = not (piece_class is Pawn and y == (1 if color == 'white' else 6))
+                    board.board[y][x] = piece
+        flags, en_passant = data[offset + 32], data[offset + 33]
+        board.turn = 'black' if flags & 1 else 'white'
+        for right, x, y in CASTLING_ROOKS:
+            if flags >> 1 & right:
+                board.board[y][4].has_moved = False
+                board.board[y][x].has_moved = False
+        if en_passant != NO_EN_PASSANT:
+            board.last_move = (en_passant, 1, en_passant, 3) if board.turn == 'black' else (en_passant, 6, en_passant, 4)
+
+        board.sync_state()
+        board.is_in_check['white'] = board.is_king_in_check('white')
+        board.is_in_check['black'] = board.is_king_in_check('black')
+        return board
+
+    def pack(self):
+        # Fixed-size encoding of everything from_fen() restores but the move counters; equal positions pack equally
+        nibbles = [0] * 64
+        for color in ('white', 'black'):
+            for x, y in self.piece_squares[color]:
+                nibbles[y * 8 + x] = PACKED_CODES[color, type(self.board[y][x])]
+        data = bytearray(nibbles[i] | nibbles[i + 1] << 4 for i in range(0, 64, 2))
+        data.append((self.turn == 'black') | self.castling << 1)
+        data.append(NO_EN_PASSANT if self.en_passant_file is None else self.en_passant_file)
+        return bytes(data)
+
+    def to_fen(self):
+        ranks = []
+        for y in range(7, -1, -1):
+            rank = ''
+            empty = 0
+            for x in range(8):
+                piece = self.board[y][x]
+                if piece == ' ':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                symbol = next(symbol for symbol, piece_class in FEN_PIECES.items() if isinstance(piece, piece_class))
+                rank += symbol.upper() if piece.color == 'white' else symbol
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        rights = self.castling_rights()
+        castling = ''.join(symbol for symbol, right in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE),
+                                                        ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE))
+                           if rights & right) or '-'
+
+        en_passant = '-'
+        if self.last_move:
+            x1, y1, x2, y2 = self.last_move
+            if abs(y2 - y1) == 2 and isinstance(self.board[y2][x2], Pawn):
+                en_passant = square_name((x2, (y1 + y2) // 2))
+
+        return f"{'/'.join(ranks)} {self.turn[0]} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+    def parse_san(self, san):
+        # Resolves a move in standard algebraic notation (e4, Nbd7, exd8=Q+, O-O) for the side to move.
+        # Only moves of the named piece type to the named square are tested for legality.
+        text = san.rstrip('+#!?')
+        color = self.turn
+        promotion = None
+        castling = text in ('O-O', '0-0', 'O-O-O', '0-0-0')
+        if castling:
+            # The king's two-square move, which only castling makes
+            piece_class = King
+            end = (6 if len(text) == 3 else 2, 0 if color == 'white' else 7)
+            hint = 'e1' if color == 'white' else 'e8'
+        else:
+            if '=' in text:
+                text, symbol = text.split('=', 1)
+                promotion = FEN_PIECES.get(symbol.lower())
+            elif len(text) > 2 and text[-1] in 'NBRQ' and text[-2].isdigit():
+                text, promotion = text[:-1], FEN_PIECES[text[-1].lower()]
+            piece_class = Pawn
+            if text and text[0] in 'NBRQK':
+                piece_class = FEN_PIECES[text[0].lower()]
+                text = text[1:]
+            text = text.replace('x', '').replace('-', '')
+            if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678':
+                raise ValueError(f"Invalid move: {san!r}")
+            end = parse_square(text[-2:])
+            hint = text[:-2]
+
+        candidates = []
+        for x, y in list(self.piece_squares[color]):
+            piece = self.board[y][x]
+            if not isinstance(piece, piece_class):
+                continue
+            if any(x != 'abcdefgh'.index(char) if char in 'abcdefgh' else y != int(char) - 1 for char in hint):
+                continue
+            for move in piece.generate_moves(self, (x, y)):
+                if move[1] != end or (move[2] if len(move) > 2 else None) is not promotion:
+                    continue
+                if piece_class is King and castling != (abs(end[0] - x) == 2):
+                    continue
+                record = self.make_move(move)
+                in_check = self.is_king_in_check(color)
+                self.unmake_move(record)
+                if not in_check:
+                    candidates.append(move)
+        if len(candidates) != 1:
+            raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {san!r}")
+        return candidates[0]
 
     def setup_pieces(self):
         for i in range(8):
@@ -204,9 +636,224 @@ class ChessBoard:
         if self.check_task:
             self.check_task.cancel()
 
-    def move_piece(self, start, end, check_only=False):
+    def copy(self):
+        board = ChessBoard(setup=False)
+        for y in range(8):
+            for x in range(8):
+                piece = self.board[y][x]
+                if piece != ' ':
+                    board.board[y][x] = piece.copy()
+        board.last_move = self.last_move
+        board.is_in_check = dict(self.is_in_check)
+        board.turn = self.turn
+        board.piece_squares = {color: set(squares) for color, squares in self.piece_squares.items()}
+        board.king_squares = dict(self.king_squares)
+        board.castling = self.castling
+        board.en_passant_file = self.en_passant_file
+        board.zobrist_key = self.zobrist_key
+        board.material_score = self.material_score
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        return board
+
+    def castling_rights(self):
+        rights = 0
+        for color, row, kingside, queenside in (('white', 0, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                                                ('black', 7, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            king = self.board[row][4]
+            if not isinstance(king, King) or king.color != color or king.has_moved:
+                continue
+            for rook_x, right in ((7, kingside), (0, queenside)):
+                rook = self.board[row][rook_x]
+                if isinstance(rook, Rook) and rook.color == color and not rook.has_moved:
+                    rights |= right
+        return rights
+
+    def get_en_passant_file(self):
+        # Only hashed when an enemy pawn could actually make the capture
+        if not self.last_move:
+            return None
+        x1, y1, x2, y2 = self.last_move
+        pawn = self.board[y2][x2]
+        if abs(y2 - y1) != 2 or not isinstance(pawn, Pawn):
+            return None
+        for x in (x2 - 1, x2 + 1):
+            if 0 <= x < 8:
+                neighbour = self.board[y2][x]
+                if isinstance(neighbour, Pawn) and neighbour.color != pawn.color:
+                    return x2
+        return None
+
+    def compute_hash(self):
+        key = 0
+        for y in range(8):
+            for x in range(8):
+                piece = self.board[y][x]
+                if piece != ' ':
+                    key ^= ZOBRIST_PIECES[piece.color, type(piece)][y * 8 + x]
+        if self.turn == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.en_passant_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_file]
+        return key
+
+    def compute_material_score(self):
+        score = 0
+        for color in ('white', 'black'):
+            for x, y in self.piece_squares[color]:
+                piece = self.board[y][x]
+                score += PIECE_SCORES[color, type(piece)][y * 8 + x]
+        return score
+
+    def sync_state(self):
+        # Recomputes the incremental state from scratch after the board was edited directly
+        self.piece_squares = {'white': set(), 'black': set()}
+        self.king_squares = {'white': None, 'black': None}
+        for y in range(8):
+            for x in range(8):
+                piece = self.board[y][x]
+                if piece != ' ':
+                    self.piece_squares[piece.color].add((x, y))
+                    if isinstance(piece, King):
+                        self.king_squares[piece.color] = (x, y)
+        self.castling = self.castling_rights()
+        self.en_passant_file = self.get_en_passant_file()
+        self.zobrist_key = self.compute_hash()
+        self.material_score = self.compute_material_score()
+
+    def make_move(self, move):
+        # Plays a pseudo-legal move without validation and returns the record unmake_move needs
+        (x1, y1), (x2, y2) = move[0], move[1]
+        piece = self.board[y1][x1]
+        captured = self.board[y2][x2]
+        captured_square = (x2, y2)
+
+        # En passant: a pawn moving diagonally onto an empty square captures beside it
+        if isinstance(piece, Pawn) and x1 != x2 and captured == ' ':
+            captured_square = (x2, y1)
+            captured = self.board[y1][x2]
+            self.board[y1][x2] = ' '
+
+        record = UndoRecord(move, piece, piece.has_moved, captured, captured_square, self.last_move)
+        record.castling = self.castling
+        record.en_passant_file = self.en_passant_file
+        record.zobrist_key = key = self.zobrist_key
+        record.material_score = score = self.material_score
+        record.halfmove_clock = self.halfmove_clock
+        self.board[y2][x2] = piece
+        self.board[y1][x1] = ' '
+        piece.has_moved = True
+
+        own_squares = self.piece_squares[piece.color]
+        own_squares.discard((x1, y1))
+        own_squares.add((x2, y2))
+        if isinstance(piece, King):
+            self.king_squares[piece.color] = (x2, y2)
+        if captured != ' ':
+            self.piece_squares[captured.color].discard(captured_square)
+
+        piece_keys = ZOBRIST_PIECES[piece.color, type(piece)]
+        piece_scores = PIECE_SCORES[piece.color, type(piece)]
+        key ^= piece_keys[y1 * 8 + x1] ^ piece_keys[y2 * 8 + x2]
+        score += piece_scores[y2 * 8 + x2] - piece_scores[y1 * 8 + x1]
+        if captured != ' ':
+            captured_index = captured_square[1] * 8 + captured_square[0]
+            key ^= ZOBRIST_PIECES[captured.color, type(captured)][captured_index]
+            score -= PIECE_SCORES[captured.color, type(captured)][captured_index]
+
+        # Castling: hop the rook over the king
+        if isinstance(piece, King) and abs(x2 - x1) == 2:
+            if x2 > x1:
+                rook_start, rook_end = (7, y1), (x1 + 1, y1)
+            else:
+                rook_start, rook_end = (0, y1), (x1 - 1, y1)
+            rook = self.board[rook_start[1]][rook_start[0]]
+            record.rook = rook
+            record.rook_start = rook_start
+            record.rook_end = rook_end
+            record.rook_had_moved = rook.has_moved
+            self.board[rook_end[1]][rook_end[0]] = rook
+            self.board[rook_start[1]][rook_start[0]] = ' '
+            rook.has_moved = True
+            own_squares.discard(rook_start)
+            own_squares.add(rook_end)
+            rook_keys = ZOBRIST_PIECES[rook.color, Rook]
+            rook_scores = PIECE_SCORES[rook.color, Rook]
+            rook_start_index = rook_start[1] * 8 + rook_start[0]
+            rook_end_index = rook_end[1] * 8 + rook_end[0]
+            key ^= rook_keys[rook_start_index] ^ rook_keys[rook_end_index]
+            score += rook_scores[rook_end_index] - rook_scores[rook_start_index]
+
+        # Promotion
+        if isinstance(piece, Pawn) and y2 in (0, 7):
+            if len(move) > 2 and move[2] is not None:
+                promoted = move[2](piece.color)
+            else:
+                promoted = self.promote_pawn(piece.color)
+            promoted.has_moved = True
+            record.promoted = promoted
+            self.board[y2][x2] = promoted
+            key ^= piece_keys[y2 * 8 + x2] ^ ZOBRIST_PIECES[piece.color, type(promoted)][y2 * 8 + x2]
+            score += PIECE_SCORES[piece.color, type(promoted)][y2 * 8 + x2] - piece_scores[y2 * 8 + x2]
+
+        self.last_move = (x1, y1, x2, y2)
+        self.halfmove_clock = 0 if captured != ' ' or isinstance(piece, Pawn) else self.halfmove_clock + 1
+        if self.turn == 'black':
+            self.fullmove_number += 1
+        self.turn = 'black' if self.turn == 'white' else 'white'
+        key ^= ZOBRIST_BLACK_TO_MOVE
+
+        key ^= ZOBRIST_CASTLING[self.castling]
+        self.castling = self.castling_rights()
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.en_passant_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_file]
+        self.en_passant_file = self.get_en_passant_file()
+        if self.en_passant_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_file]
+        self.zobrist_key = key
+        self.material_score = score
+        return record
+
+    def unmake_move(self, record):
+        (x1, y1), (x2, y2) = record.move[0], record.move[1]
+        piece = record.piece
+        self.board[y1][x1] = piece
+        self.board[y2][x2] = ' '
+        piece.has_moved = record.piece_had_moved
+
+        own_squares = self.piece_squares[piece.color]
+        own_squares.discard((x2, y2))
+        own_squares.add((x1, y1))
+        if isinstance(piece, King):
+            self.king_squares[piece.color] = (x1, y1)
+
+        captured = record.captured
+        captured_x, captured_y = record.captured_square
+        self.board[captured_y][captured_x] = captured
+        if captured != ' ':
+            self.piece_squares[captured.color].add(record.captured_square)
+
+        if record.rook is not None:
+            self.board[record.rook_start[1]][record.rook_start[0]] = record.rook
+            self.board[record.rook_end[1]][record.rook_end[0]] = ' '
+            record.rook.has_moved = record.rook_had_moved
+            own_squares.discard(record.rook_end)
+            own_squares.add(record.rook_start)
+
+        self.last_move = record.last_move
+        self.turn = 'black' if self.turn == 'white' else 'white'
+        self.castling = record.castling
+        self.en_passant_file = record.en_passant_file
+        self.zobrist_key = record.zobrist_key
+        self.material_score = record.material_score
+        self.halfmove_clock = record.halfmove_clock
+        if self.turn == 'black':
+            self.fullmove_number -= 1
+
+    def move_piece(self, start, end, check_only=False, promotion=None):
         x1, y1 = start
-        x2, y2 = end
         piece = self.board[y1][x1]
         
         if not isinstance(piece, ChessPiece):
@@ -215,48 +862,18 @@ class ChessBoard:
         if not piece.is_valid_move(self, start, end):
             return False
 
-        # Make the move temporarily
-        temp_piece = self.board[y2][x2]
-        self.board[y2][x2] = piece
-        self.board[y1][x1] = ' '
-
-        # Handle en passant capture
-        en_passant_capture = None
-        if isinstance(piece, Pawn) and abs(x2 - x1) == 1 and temp_piece == ' ':
-            if piece.color == 'white' and y1 == 4:
-                en_passant_capture = self.board[y1][x2]
-                self.board[y1][x2] = ' '
-            elif piece.color == 'black' and y1 == 3:
-                en_passant_capture = self.board[y1][x2]
-                self.board[y1][x2] = ' '
-
         # Check if the move leaves the king in check
-        king_in_check = self.is_king_in_check(piece.color)
-
-        if king_in_check:
-            # Undo the move
-            self.board[y1][x1] = piece
-            self.board[y2][x2] = temp_piece
-            if en_passant_capture:
-                self.board[y1][x2] = en_passant_capture
+        if self.leaves_king_in_check(start, end):
             return False
 
         if check_only:
-            # Undo the move and return
-            self.board[y1][x1] = piece
-            self.board[y2][x2] = temp_piece
-            if en_passant_capture:
-                self.board[y1][x2] = en_passant_capture
             return True
 
         # The move is valid, proceed with the actual move
-        if isinstance(temp_piece, ChessPiece):
-            self.captured_pieces[temp_piece.color].append(temp_piece)
-        elif en_passant_capture:
-            self.captured_pieces[en_passant_capture.color].append(en_passant_capture)
-
-        # Update last move
-        self.last_move = (x1, y1, x2, y2)
+        record = self.make_move((start, end, promotion))
+        self.move_history.append(record)
+        if isinstance(record.captured, ChessPiece):
+            self.captured_pieces[record.captured.color].append(record.captured)
 
         # After a successful move, update the check status
         self.is_in_check['white'] = self.is_king_in_check('white')
@@ -272,22 +889,73 @@ class ChessBoard:
         if not piece.is_valid_move(self, start, end):
             return False
 
-        # Temporarily make the move
-        temp_piece = self.board[end[1]][end[0]]
-        self.board[end[1]][end[0]] = self.board[start[1]][start[0]]
-        self.board[start[1]][start[0]] = ' '
-
         # Check if the move puts or leaves the king in check
-        valid = True
         if check_king_safety:
-            if self.is_king_in_check(piece.color):
-                valid = False
+            return not self.leaves_king_in_check(start, end)
+        return True
 
-        # Undo the temporary move
-        self.board[start[1]][start[0]] = self.board[end[1]][end[0]]
-        self.board[end[1]][end[0]] = temp_piece
+    def leaves_king_in_check(self, start, end):
+        color = self.board[start[1]][start[0]].color
+        record = self.make_move((start, end))
+        in_check = self.is_king_in_check(color)
+        self.unmake_move(record)
+        return in_check
 
-        return valid
+    def is_capture(self, move):
+        (x1, y1), (x2, y2) = move[0], move[1]
+        if self.board[y2][x2] != ' ':
+            return True
+        # En passant is the only capture onto an empty square
+        return x1 != x2 and isinstance(self.board[y1][x1], Pawn)
+
+    def iter_legal_moves(self, color, tactical_only=False):
+        # tactical_only restricts generation to captures and promotions
+        for x, y in list(self.piece_squares[color]):
+            piece = self.board[y][x]
+            for move in list(piece.generate_moves(self, (x, y))):
+                if tactical_only and len(move) == 2 and not self.is_capture(move):
+                    continue
+                record = self.make_move(move)
+                in_check = self.is_king_in_check(color)
+                self.unmake_move(record)
+                if not in_check:
+                    yield move
+
+    def pseudo_legal_moves(self, color):
+        # Moves that follow the piece rules but may leave the own king in check
+        moves = []
+        for x, y in self.piece_squares[color]:
+            moves.extend(self.board[y][x].generate_moves(self, (x, y)))
+        return moves
+
+    def legal_moves(self, color, tactical_only=False):
+        return list(self.iter_legal_moves(color, tactical_only))
+
+    def has_legal_moves(self, color):
+        return next(self.iter_legal_moves(color), None) is not None
+
+    def perft(self, depth):
+        # Counts the leaf nodes of the legal move tree, the standard move generator test
+        if depth == 0:
+            return 1
+        moves = self.legal_moves(self.turn)
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            record = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move(record)
+        return nodes
+
+    def divide(self, depth):
+        # Perft counts below each root move, for finding which move a wrong count comes from
+        results = {}
+        for move in self.legal_moves(self.turn):
+            record = self.make_move(move)
+            results[move_to_uci(move)] = self.perft(depth - 1)
+            self.unmake_move(record)
+        return results
 
     def promote_pawn(self, color):
         # In a real game, you'd ask the player what piece they want to promote to
@@ -296,102 +964,72 @@ class ChessBoard:
 
     def undo_move(self):
         if self.move_history:
-            start, end, captured_piece = self.move_history.pop()
-            moved_piece = self.board[end[1]][end[0]]
-            self.board[start[1]][start[0]] = moved_piece
-            self.board[end[1]][end[0]] = captured_piece
-            if isinstance(moved_piece, ChessPiece):
-                moved_piece.has_moved = False
+            record = self.move_history.pop()
+            self.unmake_move(record)
+            captured_piece = record.captured
             if isinstance(captured_piece, ChessPiece):
                 if captured_piece in self.captured_pieces[captured_piece.color]:
                     self.captured_pieces[captured_piece.color].remove(captured_piece)
-            self.last_move = None
+            self.is_in_check['white'] = self.is_king_in_check('white')
+            self.is_in_check['black'] = self.is_king_in_check('black')
 
     def is_king_in_check(self, color):
-        # Find the king's position
-        king_pos = None
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if isinstance(piece, King) and piece.color == color:
-                    king_pos = (col, row)
-                    break
-            if king_pos:
-                break
-        
+        king_pos = self.find_king(color)
         if not king_pos:
             return False  # King not found (shouldn't happen in a valid game)
 
         # Check if any opponent's piece can attack the king
-        opponent_color = 'black' if color == 'white' else 'white'
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece != ' ' and piece.color == opponent_color:
-                    if self.is_valid_move((col, row), king_pos, check_king_safety=False):
-                        return True
-
-        return False
+        return self.is_square_under_attack(king_pos, color)
 
     def is_square_under_attack(self, square, color):
         if not isinstance(square, tuple) or len(square) != 2:
             return False
-        
+
         opponent_color = 'black' if color == 'white' else 'white'
-        for y in range(8):
-            for x in range(8):
-                piece = self.board[y][x]
-                if isinstance(piece, ChessPiece) and piece.color == opponent_color:
-                    try:
-                        if piece.is_valid_move(self, (x, y), square):
+        board = self.board
+        for x, y in KNIGHT_TARGETS[square]:
+            piece = board[y][x]
+            if isinstance(piece, Knight) and piece.color == opponent_color:
+                return True
+        for x, y in KING_TARGETS[square]:
+            piece = board[y][x]
+            if isinstance(piece, King) and piece.color == opponent_color:
+                return True
+        # An enemy pawn attacks this square from where our own pawn would attack
+        for x, y in PAWN_ATTACKS[color][square]:
+            piece = board[y][x]
+            if isinstance(piece, Pawn) and piece.color == opponent_color:
+                return True
+
+        rays = RAYS[square]
+        for directions, sliders in ((ROOK_DIRECTIONS, (Rook, Queen)), (BISHOP_DIRECTIONS, (Bishop, Queen))):
+            for direction in directions:
+                for x, y in rays[direction]:
+                    piece = board[y][x]
+                    if piece != ' ':
+                        if piece.color == opponent_color and isinstance(piece, sliders):
                             return True
-                    except Exception:
-                        pass
+                        break
         return False
 
     def find_king(self, color):
-        for y in range(8):
-            for x in range(8):
-                piece = self.board[y][x]
-                if isinstance(piece, King) and piece.color == color:
-                    return (x, y)
-        return None
+        return self.king_squares[color]
 
     def is_checkmate(self, color):
         if not self.is_king_in_check(color):
             return False
-        
-        for y in range(8):
-            for x in range(8):
-                piece = self.board[y][x]
-                if isinstance(piece, ChessPiece) and piece.color == color:
-                    for end_y in range(8):
-                        for end_x in range(8):
-                            if self.move_piece((x, y), (end_x, end_y), check_only=True):
-                                return False
-        return True
+        return not self.has_legal_moves(color)
 
     def is_stalemate(self, color):
         if self.is_king_in_check(color):
             return False
-        
-        # Check if any legal move is available
-        for y in range(8):
-            for x in range(8):
-                piece = self.board[y][x]
-                if isinstance(piece, ChessPiece) and piece.color == color:
-                    for end_y in range(8):
-                        for end_x in range(8):
-                            if self.move_piece((x, y), (end_x, end_x), check_only=True):
-                                return False
-        return True
+        return not self.has_legal_moves(color)
 
     def get_game_state(self, current_player):
-        if self.is_checkmate(current_player):
-            return 'checkmate'
-        if self.is_stalemate(current_player):
-            return 'stalemate'
-        if self.is_in_check[current_player]:
+        in_check = self.is_king_in_check(current_player)
+        if not self.has_legal_moves(current_player):
+            return 'checkmate' if in_check else 'stalemate'
+        if in_check:
             return 'check'
         return 'ongoing'
 
@@ -441,29 +1079,10 @@ class ChessBoard:
         print()
 
     def print_valid_moves_in_check(self, color):
-        valid_moves = []
-        for y in range(8):
-            for x in range(8):
-                piece = self.board[y][x]
-                if isinstance(piece, ChessPiece) and piece.color == color:
-                    for end_y in range(8):
-                        for end_x in range(8):
-                            if piece.is_valid_move(self, (x, y), (end_x, end_y)):
-                                # Temporarily make the move
-                                temp_piece = self.board[end_y][end_x]
-                                self.board[end_y][end_x] = piece
-                                self.board[y][x] = ' '
-                                
-                                # Check if the king is still in check
-                                if not self.is_king_in_check(color):
-                                    valid_moves.append(((x, y), (end_x, end_y)))
-                                
-                                # Undo the move
-                                self.board[y][x] = piece
-                                self.board[end_y][end_x] = temp_piece
+        valid_moves = self.legal_moves(color)
 
         print(f"Valid moves for {color} when king is in check:")
-        for start, end in valid_moves:
+        for start, end, *_ in valid_moves:
             piece = self.board[start[1]][start[0]]
             print(f"{type(piece).__name__} from {start} to {end}")
 
@@ -493,13 +1112,107 @@ async def play_chess():
             board.display()
             start = input("Enter start position (e.g., e2): ")
             end = input("Enter end position (e.g., e4): ")
-            start = (ord(start[0]) - ord('a'), int(start[1]) - 1)
-            end = (ord(end[0]) - ord('a'), int(end[1]) - 1)
+            start = parse_square(start)
+            end = parse_square(end)
             if board.move_piece(start, end):
                 current_player = 'black' if current_player == 'white' else 'white'
             await asyncio.sleep(0.1)  # Small delay to allow other tasks to run
     finally:
         board.stop_check_task()
 
+# Standard perft positions with their published node counts per depth
+PERFT_POSITIONS = [
+    ('start position', STARTING_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ('illegal en passant 1', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', {6: 1134888}),
+    ('illegal en passant 2', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', {6: 1015133}),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', {6: 1440467}),
+    ('short castling gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1', {6: 661072}),
+    ('long castling gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', {6: 803711}),
+    ('castling rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', {4: 1274206}),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', {4: 1720476}),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', {6: 3821001}),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', {5: 1004658}),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1', {6: 217342}),
+    ('underpromote to give check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1', {6: 92683}),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1', {6: 2217}),
+    ('stalemate and checkmate 1', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1', {7: 567584}),
+    ('stalemate and checkmate 2', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', {4: 23527}),
+]
+
+def run_perft(fen, depth):
+    board = ChessBoard.from_fen(fen)
+    start_time = time.perf_counter()
+    nodes = board.perft(depth)
+    elapsed = time.perf_counter() - start_time
+    return nodes, elapsed
+
+def print_perft_result(nodes, elapsed):
+    nps = nodes / elapsed if elapsed > 0 else 0
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"Nodes per second: {nps:.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m chess', description="Play chess in the terminal or test the move generator.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    perft_parser = subparsers.add_parser('perft', help="count leaf nodes of the legal move tree")
+    perft_parser.add_argument('--fen', default=STARTING_FEN)
+    perft_parser.add_argument('--depth', type=int, default=3)
+
+    divide_parser = subparsers.add_parser('divide', help="perft counts below each root move")
+    divide_parser.add_argument('--fen', default=STARTING_FEN)
+    divide_parser.add_argument('--depth', type=int, default=3)
+
+    suite_parser = subparsers.add_parser('suite', help="check the bundled perft positions against their known counts")
+    suite_parser.add_argument('--max-depth', type=int, default=3, help="skip depths above this")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'perft':
+        print_perft_result(*run_perft(args.fen, args.depth))
+    elif args.command == 'divide':
+        board = ChessBoard.from_fen(args.fen)
+        start_time = time.perf_counter()
+        results = board.divide(args.depth)
+        elapsed = time.perf_counter() - start_time
+        for move, nodes in sorted(results.items()):
+            print(f"{move}: {nodes}")
+        print(f"Moves: {len(results)}")
+        print_perft_result(sum(results.values()), elapsed)
+    elif args.command == 'suite':
+        failures = 0
+        total_nodes = 0
+        total_time = 0.0
+        for name, fen, expected in PERFT_POSITIONS:
+            for depth, expected_nodes in sorted(expected.items()):
+                if depth > args.max_depth:
+                    continue
+                nodes, elapsed = run_perft(fen, depth)
+                total_nodes += nodes
+                total_time += elapsed
+                status = 'ok' if nodes == expected_nodes else 'FAIL'
+                failures += status == 'FAIL'
+                print(f"{status:4} {name} depth {depth}: {nodes} (expected {expected_nodes}) {elapsed:.2f}s")
+        print()
+        print_perft_result(total_nodes, total_time)
+        if failures:
+            print(f"{failures} perft check(s) failed")
+            return 1
+    else:
+        asyncio.run(play_chess())
+    return 0
+
 if __name__ == "__main__":
-    asyncio.run(play_chess())
+    raise SystemExit(main())
@@ -0,0 +1,904 @@
+import math
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from enum import Enum
+from book import OpeningBook
+from chess import ChessBoard, Pawn, Knight, Bishop, PIECE_VALUES
+from tablebase import TablebaseProber, DRAW, LOSS, MAX_PIECES as TABLEBASE_PIECES
+
+class Difficulty(Enum):
+    EASY = 1
+    MEDIUM = 2
+    HARD = 3
+
+
+MATE_SCORE = 100000
+TABLEBASE_WIN = MATE_SCORE // 2  # Tablebase wins score below found mates, less the plies to mate
+CENTER_SQUARES = [(3, 3), (3, 4), (4, 3), (4, 4)]
+# (row, col, piece type, score change) for minor pieces still on their starting squares
+UNDEVELOPED_PIECES = [
+    (0, 1, Knight, -10), (0, 6, Knight, -10), (7, 1, Knight, 10), (7, 6, Knight, 10),
+    (0, 2, Bishop, -10), (0, 5, Bishop, -10), (7, 2, Bishop, 10), (7, 5, Bishop, 10),
+]
+
+MAX_PLY = 64  # Deepest ply that keeps killer moves
+DELTA_MARGIN = 200  # Quiescence skips captures that cannot lift the score this close to alpha
+ROLLOUTS_PER_WORKER = 2  # Rollouts kept in flight per worker by the parallel MCTS
+ROLLOUT_BATCH = 256  # Leaves played out together by the NumPy playouts
+ROLLOUT_PLIES = 100  # Longest random playout
+ROLLOUT_DECISIVE_SCORE = 1000  # Playouts stop once one side leads by this much
+MAX_TREE_NODES = 500000  # MCTS node cap; the least visited branches are collapsed beyond it
+
+# Transposition table bound types
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+TT_ENTRY_BYTES = 160  # Rough size of one stored entry tuple, its key and its list slot
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.size = max(1, int(size_mb * 1024 * 1024) // TT_ENTRY_BYTES)
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        # Entries from earlier searches may be replaced regardless of depth
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, flag, best_move):
+        index = key % self.size
+        entry = self.entries[index]
+        if entry is not None:
+            # Depth-preferred replacement within a search, always-replace across searches
+            if entry[0] != key and entry[5] == self.generation and entry[1] > depth:
+                return
+            if entry[0] != key:
+                self.overwrites += 1
+        self.entries[index] = (key, depth, score, flag, best_move, self.generation)
+        self.stores += 1
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'size': self.size,
+        }
+
+class SearchTimeout(Exception):
+    pass
+
+class MCTSNode:
+    # Nodes hold only the move that reaches them; positions are replayed from the root
+    __slots__ = ('move', 'children', 'visits', 'score')
+
+    def __init__(self, move=None):
+        self.move = move
+        self.children = []
+        self.visits = 0
+        self.score = 0
+
+class ChessAI:
+    def __init__(self, difficulty, tt_size_mb=16, incremental_eval=True, max_nodes=None, workers=1, book_path=None,
+                 tablebase_path=None, rollout_batch=0):
+        self.difficulty = difficulty
+        self.max_thinking_time = 5  # Maximum thinking time in seconds
+        self.max_nodes = max_nodes  # Optional node budget per move for the minimax search
+        self.current_board = None
+        self.max_depth = 2 if difficulty == Difficulty.MEDIUM else 4 if difficulty == Difficulty.HARD else 1
+        self.exploration_constant = 1.41  # UCT exploration constant
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        self.incremental_eval = incremental_eval  # Read material + PST from the board's running score
+        self.nodes = 0
+        self.deadline = None
+        self.depth_stats = []  # One entry per completed iterative deepening depth
+        self.partial_best_move = None
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}  # (color, start, end) -> score of quiet moves that caused cutoffs
+        self.ordering_stats = {'cutoffs': 0, 'first_move_cutoffs': 0}
+        self.tt_size_mb = tt_size_mb
+        self.workers = workers  # Processes sharing the root moves; 1 searches in this process
+        self.executor = None
+        self.shared_bound = None
+        self.mcts_stats = {}
+        self.reuse_tree = True  # Keep the MCTS subtree of the position reached after our move
+        self.mcts_root = None
+        self.mcts_board = None  # Position of mcts_root
+        self.max_tree_nodes = MAX_TREE_NODES
+        self.tree_nodes = 0
+        self.iterations = 0
+        self.search_depth = 0  # Depth being searched, for progress displays
+        self.stop_event = threading.Event()
+        self.ponder_lock = threading.Lock()
+        self.ponder_key = None  # Position being pondered: our last move plus the predicted reply
+        self.ponder_start = None
+        self.ponder_hit_time = None
+        self.ponder_done = False
+        self.ponder_result = None
+        self.ponder_tree = None  # MCTS tree after a ponder search that ended before ponder_hit()
+        self.book = OpeningBook(book_path) if book_path else None
+        self.book_hits = 0
+        self.tablebase_path = tablebase_path
+        self.tablebases = TablebaseProber(tablebase_path) if tablebase_path else None
+        self.rollout_batch = rollout_batch  # Leaves per batch of NumPy playouts; 0 plays them one at a time
+
+    def get_best_move(self, board, color, stop_event=None, ponder=False):
+        # stop_event lets another thread cancel the search; the best move found so far is returned.
+        # A ponder search keeps the open deadline set by ponder() until ponder_hit() sets one.
+        self.stop_event = stop_event or threading.Event()
+        if not ponder:
+            self.deadline = time.perf_counter() + self.max_thinking_time
+        self.nodes = 0
+        self.iterations = 0
+        self.search_depth = 0
+        self.current_board = board
+        self.current_color = color
+        if self.book and self.difficulty != Difficulty.EASY:
+            # Book moves skip move generation and search entirely
+            move = self.book.choose_move(board)
+            if move is not None:
+                self.book_hits += 1
+                return move
+        moves = self.get_all_valid_moves(color)
+        
+        if not moves:
+            return None
+
+        if self.difficulty == Difficulty.EASY:
+            return random.choice(moves)
+        elif self.difficulty == Difficulty.MEDIUM:
+            return self.get_best_move_minimax(board, color)
+        else:  # HARD
+            return self.get_best_move_mcts(board, color)
+    
+    def get_best_move_minimax(self, board, color):
+        # Iterative deepening: search depth 1, 2, 3... until the time or node budget runs out
+        self.transposition_table.new_search()
+        search_board = board.copy()
+        moves = search_board.legal_moves(color)
+        self.nodes = 0
+        self.depth_stats = []
+        self.partial_best_move = None
+        self.new_search_ordering()
+        if len(moves) == 1:
+            return moves[0]
+        moves = self.order_moves(search_board, moves, 0)
+
+        best_move = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            self.search_depth = depth
+            depth_start = time.perf_counter()
+            try:
+                if self.workers > 1:
+                    move, score = self.search_root_parallel(search_board, moves, depth, color)
+                else:
+                    move, score = self.search_root(search_board, moves, depth, color)
+            except SearchTimeout:
+                if not self.depth_stats and self.partial_best_move is not None:
+                    best_move = self.partial_best_move
+                break
+            best_move = move
+            self.depth_stats.append({
+                'depth': depth,
+                'move': move,
+                'score': score,
+                'nodes': self.nodes,
+                'time': time.perf_counter() - depth_start,
+            })
+            # Search the previous iteration's best move first
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= MATE_SCORE:
+                break
+
+        return best_move
+
+    def new_search_ordering(self):
+        # Killers belong to the previous position; history is kept but aged
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {key: value // 2 for key, value in self.history.items() if value > 1}
+        self.ordering_stats = {'cutoffs': 0, 'first_move_cutoffs': 0}
+
+    def first_move_cutoff_rate(self):
+        cutoffs = self.ordering_stats['cutoffs']
+        return self.ordering_stats['first_move_cutoffs'] / cutoffs if cutoffs else 0.0
+
+    def is_tactical(self, board, move):
+        return len(move) > 2 or board.is_capture(move)
+
+    def capture_gain(self, board, move):
+        # Material the move can win at most, used for delta pruning
+        x2, y2 = move[1]
+        victim = board.board[y2][x2]
+        gain = PIECE_VALUES[type(victim)] if victim != ' ' else 0
+        if victim == ' ' and board.is_capture(move):
+            gain = PIECE_VALUES[Pawn]
+        if len(move) > 2:
+            gain += PIECE_VALUES[move[2]] - PIECE_VALUES[Pawn]
+        return gain
+
+    def mvv_lva(self, board, move):
+        # Most valuable victim first, least valuable attacker breaking ties
+        (x1, y1), (x2, y2) = move[0], move[1]
+        attacker = board.board[y1][x1]
+        victim = board.board[y2][x2]
+        score = -PIECE_VALUES[type(attacker)]
+        if victim != ' ':
+            score += 10 * PIECE_VALUES[type(victim)]
+        elif x1 != x2 and isinstance(attacker, Pawn):
+            score += 10 * PIECE_VALUES[Pawn]
+        if len(move) > 2:
+            score += PIECE_VALUES[move[2]]
+        return score
+
+    def order_moves(self, board, moves, ply, tt_move=None):
+        # Hash move, then captures by MVV-LVA, then killer moves, then quiet moves by history
+        killers = self.killer_moves[ply] if ply < MAX_PLY else (None, None)
+        color = board.turn
+
+        def sort_key(move):
+            if move == tt_move:
+                return (3, 0)
+            if self.is_tactical(board, move):
+                return (2, self.mvv_lva(board, move))
+            if move == killers[0]:
+                return (1, 1)
+            if move == killers[1]:
+                return (1, 0)
+            return (0, self.history.get((color, move[0], move[1]), 0))
+
+        return sorted(moves, key=sort_key, reverse=True)
+
+    def record_cutoff(self, board, move, depth, ply, move_index):
+        self.ordering_stats['cutoffs'] += 1
+        if move_index == 0:
+            self.ordering_stats['first_move_cutoffs'] += 1
+        if self.is_tactical(board, move):
+            return
+        if ply < MAX_PLY:
+            killers = self.killer_moves[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        key = (board.turn, move[0], move[1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def search_root(self, board, moves, depth, color):
+        maximizing_player = color == 'white'
+        alpha, beta = float('-inf'), float('inf')
+        best_move, best_score = None, None
+        for move in moves:
+            record = board.make_move(move)
+            try:
+                score = self.minimax(board, depth - 1, alpha, beta, not maximizing_player, 1)
+            finally:
+                board.unmake_move(record)
+
+            if best_move is None or (score > best_score if maximizing_player else score < best_score):
+                best_move, best_score = move, score
+                self.partial_best_move = move
+                if maximizing_player:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+        return best_move, best_score
+
+    def predict_reply(self, board):
+        # The opponent's most likely move in `board`, the position after our move
+        if self.difficulty == Difficulty.MEDIUM:
+            entry = self.transposition_table.probe(board.zobrist_key)
+            if entry is not None and entry[4] in board.legal_moves(board.turn):
+                return entry[4]
+        elif self.difficulty == Difficulty.HARD:
+            if self.mcts_root is not None and self.mcts_root.children and self.mcts_board.zobrist_key == board.zobrist_key:
+                return max(self.mcts_root.children, key=lambda c: c.visits).move
+        return None
+
+    def ponder(self, board, stop_event):
+        # Thinks on the opponent's time about the position after the predicted reply. Returns our
+        # move if ponder_hit() arrived while searching; a search that ends before then is kept
+        # for ponder_hit() to hand out.
+        reply = self.predict_reply(board)
+        if reply is None:
+            return None
+        ponder_board = board.copy()
+        ponder_board.make_move(reply)
+        with self.ponder_lock:
+            self.ponder_key = ponder_board.zobrist_key
+            self.ponder_start = time.perf_counter()
+            self.ponder_hit_time = None
+            self.ponder_done = False
+            self.ponder_result = self.ponder_tree = None
+            self.deadline = float('inf')
+
+        # The search advances the MCTS tree past the predicted reply; the tree from before it
+        # still holds the other replies, so it is put back unless the prediction is confirmed
+        previous_tree = (self.mcts_root, self.mcts_board)
+        move = self.get_best_move(ponder_board, ponder_board.turn, stop_event, ponder=True)
+        with self.ponder_lock:
+            if stop_event.is_set():
+                self.ponder_key = None
+                self.mcts_root, self.mcts_board = previous_tree
+                return None
+            if self.ponder_hit_time is not None:
+                self.ponder_key = None
+                return move
+            self.ponder_done = True
+            self.ponder_result = move
+            self.ponder_tree = (self.mcts_root, self.mcts_board)
+            self.mcts_root, self.mcts_board = previous_tree
+            return None
+
+    def ponder_hit(self, board):
+        # Called once the opponent has moved. Returns ('ready', move) when the ponder search has
+        # finished, ('searching', None) when it continues with the time already spent pondering
+        # counted against max_thinking_time, and ('miss', None) when the caller should stop it.
+        with self.ponder_lock:
+            if self.ponder_key is None or self.ponder_key != board.zobrist_key:
+                return 'miss', None
+            if self.ponder_done:
+                self.ponder_key = None
+                self.mcts_root, self.mcts_board = self.ponder_tree
+                self.ponder_tree = None
+                return 'ready', self.ponder_result
+            self.ponder_hit_time = time.perf_counter()
+            self.deadline = max(self.ponder_hit_time, self.ponder_start + self.max_thinking_time)
+            return 'searching', None
+
+    def search_info(self):
+        # Progress of the running search; safe to read from another thread
+        return {'depth': self.search_depth, 'nodes': self.nodes, 'iterations': self.iterations}
+
+    def reset(self):
+        # Forgets everything tied to the previous game
+        self.mcts_root = self.mcts_board = None
+        self.ponder_key = self.ponder_result = self.ponder_tree = None
+        self.transposition_table.clear()
+        self.history = {}
+
+    def search_root_parallel(self, board, moves, depth, color):
+        # The first move is searched here to set the bound, the rest are split across the workers,
+        # which read the best score found so far before they start and raise it when they beat it
+        maximizing_player = color == 'white'
+        record = board.make_move(moves[0])
+        try:
+            best_score = self.minimax(board, depth - 1, float('-inf'), float('inf'), not maximizing_player, 1)
+        finally:
+            board.unmake_move(record)
+        best_move = moves[0]
+        self.partial_best_move = best_move
+        if len(moves) == 1:
+            return best_move, best_score
+
+        executor = self.get_executor()
+        self.shared_bound.value = best_score
+        position = board.pack()
+        time_left = self.deadline - time.perf_counter()
+        # The nodes left are shared out evenly so that the workers together stay within max_nodes
+        node_budget = None if self.max_nodes is None else max(1, (self.max_nodes - self.nodes) // (len(moves) - 1))
+        futures = [executor.submit(search_root_move, position, move, depth, time_left, node_budget)
+                   for move in moves[1:]]
+
+        timed_out = False
+        # Results are read in root order so that equal scores keep the earlier move
+        for future in futures:
+            move, score, exact, nodes = future.result()
+            self.nodes += nodes
+            if score is None:
+                timed_out = True
+            elif exact and (score > best_score if maximizing_player else score < best_score):
+                best_move, best_score = move, score
+                self.partial_best_move = move
+        if timed_out or (self.max_nodes is not None and self.nodes >= self.max_nodes):
+            raise SearchTimeout
+        return best_move, best_score
+
+    def get_executor(self):
+        if self.executor is None:
+            self.shared_bound = multiprocessing.Value('d', 0.0)
+            self.executor = ProcessPoolExecutor(self.workers, initializer=init_search_worker,
+                                                initargs=(self.shared_bound, self.tt_size_mb, self.incremental_eval,
+                                                          self.tablebase_path))
+        return self.executor
+
+    def close(self):
+        if self.book:
+            self.book.close()
+            self.book = None
+        if self.tablebases:
+            self.tablebases.close()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.shared_bound = None
+
+    def minimax(self, board, depth, alpha, beta, maximizing_player, ply=0):
+        self.nodes += 1
+        if (time.perf_counter() >= self.deadline or self.stop_event.is_set()
+                or (self.max_nodes is not None and self.nodes >= self.max_nodes)):
+            raise SearchTimeout
+
+        if ply > 0:
+            score = self.tablebase_score(board, ply)
+            if score is not None:
+                return score
+
+        key = board.zobrist_key
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            _, entry_depth, entry_score, flag, tt_move, _ = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, entry_score)
+                elif flag == UPPER_BOUND:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        if depth == 0:
+            return self.quiescence(board, alpha, beta, maximizing_player, ply)
+
+        color = 'white' if maximizing_player else 'black'
+        moves = board.legal_moves(color)
+        if not moves:
+            score = self.terminal_score(board, color, depth)
+            self.transposition_table.store(key, depth, score, EXACT, None)
+            return score
+
+        moves = self.order_moves(board, moves, ply, tt_move)
+
+        best_move = None
+        if maximizing_player:
+            best_eval = float('-inf')
+            for index, move in enumerate(moves):
+                record = board.make_move(move)
+                try:
+                    eval = self.minimax(board, depth - 1, alpha, beta, False, ply + 1)
+                finally:
+                    board.unmake_move(record)
+                if eval > best_eval:
+                    best_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    self.record_cutoff(board, move, depth, ply, index)
+                    break
+        else:
+            best_eval = float('inf')
+            for index, move in enumerate(moves):
+                record = board.make_move(move)
+                try:
+                    eval = self.minimax(board, depth - 1, alpha, beta, True, ply + 1)
+                finally:
+                    board.unmake_move(record)
+                if eval < best_eval:
+                    best_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    self.record_cutoff(board, move, depth, ply, index)
+                    break
+
+        if best_eval <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best_eval >= beta_orig:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table.store(key, depth, best_eval, flag, best_move)
+        return best_eval
+        
+    def get_best_move_mcts(self, board, color):
+        root = self.reuse_mcts_tree(board) if self.reuse_tree else None
+        reused_visits = root.visits if root else 0
+        if root is None:
+            root = MCTSNode()
+        self.tree_nodes = self.count_tree_nodes(root)
+        search_board = board.copy()
+        if not root.children:
+            # A move is returned even if the time runs out before the first iteration
+            self.expand(root, search_board)
+        start = time.perf_counter()
+
+        if self.workers > 1:
+            self.run_mcts_parallel(root, search_board)
+        elif self.rollout_batch > 1:
+            self.run_mcts_batched(root, search_board)
+        else:
+            while time.perf_counter() < self.deadline and not self.stop_event.is_set():
+                path, records = self.select_leaf(root, search_board)
+                result = self.simulate(search_board, search_board.turn)
+                self.unwind(search_board, records)
+                self.backpropagate(path, self.rollout_value(result), search_board.turn)
+                self.iterations += 1
+
+        elapsed = time.perf_counter() - start
+        self.mcts_stats = {
+            'iterations': self.iterations,
+            'time': elapsed,
+            'iterations_per_second': self.iterations / elapsed if elapsed else 0.0,
+            'workers': self.workers,
+            'reused_visits': reused_visits,
+            'tree_nodes': self.tree_nodes,
+        }
+        best_child = max(root.children, key=lambda c: c.visits)
+        if self.reuse_tree:
+            # Only the subtree under our move can be reached again
+            search_board.make_move(best_child.move)
+            self.mcts_root = best_child
+            self.mcts_board = search_board
+        return best_child.move
+
+    def reuse_mcts_tree(self, board):
+        # Looks for the position after our last move and the opponent's reply and makes it the root
+        previous, previous_board = self.mcts_root, self.mcts_board
+        self.mcts_root = self.mcts_board = None
+        if previous is None:
+            return None
+        if previous_board.zobrist_key == board.zobrist_key:
+            return previous
+        for child in previous.children:
+            record = previous_board.make_move(child.move)
+            found = previous_board.zobrist_key == board.zobrist_key
+            previous_board.unmake_move(record)
+            if found:
+                return child
+        return None
+
+    def count_tree_nodes(self, root):
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.children)
+        return count
+
+    def prune_tree(self, root):
+        # Collapses the least visited expanded nodes back into leaves until the tree is at 3/4 of the cap.
+        # Collapsed nodes keep their statistics and are expanded again if the search returns to them.
+        expanded = []
+        stack = [(child, 1) for child in root.children]
+        while stack:
+            node, depth = stack.pop()
+            if node.children:
+                expanded.append((node.visits, -depth, node))
+                stack.extend((child, depth + 1) for child in node.children)
+        # A node never has more visits than its parent, so descendants are collapsed before ancestors
+        expanded.sort(key=lambda item: item[:2])
+        target = self.max_tree_nodes * 3 // 4
+        for _, _, node in expanded:
+            if self.tree_nodes <= target:
+                break
+            self.tree_nodes -= self.count_tree_nodes(node) - 1
+            node.children = []
+
+    def run_mcts_parallel(self, root, board):
+        # Leaf parallelism: rollouts run in the worker pool while the tree stays here. Pending
+        # paths carry a virtual loss so the next selections spread over other branches.
+        executor = self.get_executor()
+        pending = {}
+        while pending or (time.perf_counter() < self.deadline and not self.stop_event.is_set()):
+            while (time.perf_counter() < self.deadline and not self.stop_event.is_set()
+                   and len(pending) < self.workers * ROLLOUTS_PER_WORKER):
+                path, records = self.select_leaf(root, board)
+                position = board.pack()
+                self.unwind(board, records)
+                self.add_virtual_loss(path)
+                pending[executor.submit(rollout_position, position)] = path
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                self.remove_virtual_loss(path)
+                self.backpropagate(path, self.rollout_value(future.result()), board.turn)
+                self.iterations += 1
+
+    def run_mcts_batched(self, root, board):
+        # Selects a batch of leaves, with a virtual loss on each path so the selections spread over
+        # the tree, and plays them all out at once on arrays. NumPy is only needed for this mode.
+        from batch_eval import encode_board, join_encoded, random_playouts
+        while time.perf_counter() < self.deadline and not self.stop_event.is_set():
+            paths = []
+            leaves = []
+            sides = []
+            for _ in range(self.rollout_batch):
+                path, records = self.select_leaf(root, board)
+                score = self.tablebase_score(board)
+                if score is None and path[-1].visits > 0 and not path[-1].children:
+                    score = self.terminal_score(board, board.turn)  # Expanded, and has no moves
+                if score is None:
+                    leaves.append(encode_board(board))
+                    sides.append(1 if board.turn == 'white' else -1)
+                self.unwind(board, records)
+                if score is None:
+                    self.add_virtual_loss(path)
+                    paths.append(path)
+                else:
+                    self.backpropagate(path, self.rollout_value(score), board.turn)
+                    self.iterations += 1
+            if not paths:
+                continue
+            for path, score in zip(paths, random_playouts(join_encoded(leaves), sides)):
+                self.remove_virtual_loss(path)
+                self.backpropagate(path, self.rollout_value(int(score)), board.turn)
+                self.iterations += 1
+
+    def select_leaf(self, root, board):
+        # Descends from the root, playing each move on `board`. Returns the nodes on the path and
+        # the undo records; `board` is left at the leaf position until unwind() is called.
+        path = [root]
+        records = []
+        node = root
+        while node.children:
+            unvisited = [child for child in node.children if child.visits == 0]
+            node = random.choice(unvisited) if unvisited else self.uct_select(node)
+            records.append(board.make_move(node.move))
+            path.append(node)
+            if unvisited:
+                break
+
+        if node.visits > 0 or node is root:
+            # Expand a leaf the second time it is reached; terminal positions have no children
+            child = self.expand(node, board)
+            if child is not None:
+                records.append(board.make_move(child.move))
+                path.append(child)
+                if self.tree_nodes > self.max_tree_nodes:
+                    self.prune_tree(root)
+        return path, records
+
+    def unwind(self, board, records):
+        for record in reversed(records):
+            board.unmake_move(record)
+
+    def expand(self, node, board):
+        node.children = [MCTSNode(move) for move in board.legal_moves(board.turn)]
+        self.tree_nodes += len(node.children)
+        return random.choice(node.children) if node.children else None
+
+    def quiescence(self, board, alpha, beta, maximizing_player, ply, depth=0):
+        # Searches captures and promotions until the position is quiet, so leaves are not
+        # scored in the middle of an exchange. depth goes negative to rank deeper mates lower.
+        self.nodes += 1
+        if (time.perf_counter() >= self.deadline or self.stop_event.is_set()
+                or (self.max_nodes is not None and self.nodes >= self.max_nodes)):
+            raise SearchTimeout
+
+        score = self.tablebase_score(board, ply)
+        if score is not None:
+            return score
+
+        color = 'white' if maximizing_player else 'black'
+        in_check = board.is_king_in_check(color)
+        if in_check:
+            # No standing pat in check: every evasion is searched
+            moves = board.legal_moves(color)
+            if not moves:
+                return self.terminal_score(board, color, depth)
+            best_eval = float('-inf') if maximizing_player else float('inf')
+        else:
+            stand_pat = self.evaluate_board(board)
+            if maximizing_player:
+                if stand_pat >= beta:
+                    return stand_pat
+                alpha = max(alpha, stand_pat)
+            else:
+                if stand_pat <= alpha:
+                    return stand_pat
+                beta = min(beta, stand_pat)
+            best_eval = stand_pat
+            moves = board.legal_moves(color, tactical_only=True)
+
+        for move in self.order_moves(board, moves, ply):
+            if not in_check:
+                gain = self.capture_gain(board, move) + DELTA_MARGIN
+                if (stand_pat + gain <= alpha) if maximizing_player else (stand_pat - gain >= beta):
+                    continue
+            record = board.make_move(move)
+            try:
+                eval = self.quiescence(board, alpha, beta, not maximizing_player, ply + 1, depth - 1)
+            finally:
+                board.unmake_move(record)
+            if maximizing_player:
+                best_eval = max(best_eval, eval)
+                alpha = max(alpha, eval)
+            else:
+                best_eval = min(best_eval, eval)
+                beta = min(beta, eval)
+            if beta <= alpha:
+                break
+        return best_eval
+
+    def simulate(self, board, color):
+        # Random playout on the board itself, taken back afterwards. Moves are drawn from the
+        # pseudo-legal list and only the drawn move is checked for legality, so a position is
+        # known to be terminal only once every draw has failed.
+        records = []
+        current_color = color
+        score = None
+
+        for _ in range(ROLLOUT_PLIES):
+            score = self.tablebase_score(board)
+            if score is not None:
+                break
+            if abs(board.material_score) >= ROLLOUT_DECISIVE_SCORE:
+                break
+            moves = board.pseudo_legal_moves(current_color)
+            record = None
+            while moves:
+                index = random.randrange(len(moves))
+                record = board.make_move(moves[index])
+                if not board.is_king_in_check(current_color):
+                    break
+                board.unmake_move(record)
+                record = None
+                moves[index] = moves[-1]
+                moves.pop()
+            if record is None:
+                score = self.terminal_score(board, current_color)
+                break
+            records.append(record)
+            current_color = 'black' if current_color == 'white' else 'white'
+
+        if score is None:
+            score = self.evaluate_board(board)
+        for record in reversed(records):
+            board.unmake_move(record)
+        return score
+
+    def evaluate_board(self, board):
+        # Terminal positions are scored by the search, not here
+        if self.incremental_eval:
+            score = board.material_score
+        else:
+            score = board.compute_material_score()
+
+        # Evaluate pawn structure
+        for color, sign in (('white', 1), ('black', -1)):
+            pawn_files = [0] * 8
+            for col, row in board.piece_squares[color]:
+                if isinstance(board.board[row][col], Pawn):
+                    pawn_files[col] += 1
+            for pawns in pawn_files:
+                if pawns > 1:
+                    score -= sign * 10 * (pawns - 1)  # Penalize doubled pawns
+
+        # Evaluate control of the center
+        for row, col in CENTER_SQUARES:
+            piece = board.board[row][col]
+            if piece != ' ':
+                if piece.color == 'white':
+                    score += 10
+                else:
+                    score -= 10
+
+        # Evaluate king safety
+        # Penalize if kings are not in their starting positions (assuming they haven't castled)
+        if board.king_squares['white'] != (4, 0):
+            score -= 20
+        if board.king_squares['black'] != (4, 7):
+            score += 20
+
+        # Evaluate piece development (encourage pieces to move from their starting positions)
+        for row, col, piece_type, penalty in UNDEVELOPED_PIECES:
+            if isinstance(board.board[row][col], piece_type):
+                score += penalty
+
+        return score
+
+    def tablebase_score(self, board, ply=0):
+        # White-positive score of a position the tablebases cover, None otherwise
+        if (self.tablebases is None
+                or len(board.piece_squares['white']) + len(board.piece_squares['black']) > TABLEBASE_PIECES):
+            return None
+        result = self.tablebases.probe(board)
+        if result is None:
+            return None
+        outcome, plies = result
+        if outcome == DRAW:
+            return 0
+        score = TABLEBASE_WIN - ply - plies
+        if outcome == LOSS:
+            score = -score
+        return score if board.turn == 'white' else -score
+
+    def terminal_score(self, board, color, depth=0):
+        # Score of a position where `color` has no legal moves; quicker mates score higher
+        if not board.is_king_in_check(color):
+            return 0  # Stalemate
+        return -(MATE_SCORE + depth) if color == 'white' else MATE_SCORE + depth
+
+    def rollout_value(self, score):
+        # Maps a white-positive rollout score to white's expected result between 0 and 1
+        return 1 / (1 + 10 ** (-score / 400))
+
+    def backpropagate(self, path, result, root_turn):
+        # Each node scores the result for the side that made its move; the root's mover is the
+        # side not to move there, and movers alternate down the path
+        white_moved = root_turn == 'black'
+        for node in path:
+            node.visits += 1
+            node.score += result if white_moved else 1 - result
+            white_moved = not white_moved
+
+    def add_virtual_loss(self, path):
+        # Counts a pending rollout as a lost visit until its result comes back
+        for node in path:
+            node.visits += 1
+
+    def remove_virtual_loss(self, path):
+        for node in path:
+            node.visits -= 1
+
+    def uct_select(self, node):
+        return max(node.children, key=lambda c: c.score / c.visits + 
+                   self.exploration_constant * math.sqrt(math.log(node.visits) / c.visits))
+
+    def get_all_valid_moves(self, color):
+        return self.current_board.legal_moves(color)
+
+# Per-process state of the search and rollout workers, set up by init_search_worker
+worker_ai = None
+worker_bound = None
+
+def init_search_worker(shared_bound, tt_size_mb, incremental_eval, tablebase_path):
+    global worker_ai, worker_bound
+    worker_ai = ChessAI(Difficulty.MEDIUM, tt_size_mb, incremental_eval, tablebase_path=tablebase_path)
+    worker_bound = shared_bound
+    # Forked workers inherit the parent's random state; rollouts must differ between them
+    random.seed()
+
+def search_root_move(position, move, depth, time_left, max_nodes):
+    # Searches one root move of a packed position in a worker; returns (move, score, exact, nodes),
+    # score None on timeout
+    board = ChessBoard.unpack(position)
+    maximizing_player = board.turn == 'white'
+    worker_ai.nodes = 0
+    worker_ai.max_nodes = max_nodes
+    worker_ai.deadline = time.perf_counter() + time_left
+    bound = worker_bound.value
+    alpha, beta = (bound, float('inf')) if maximizing_player else (float('-inf'), bound)
+
+    board.make_move(move)
+    try:
+        score = worker_ai.minimax(board, depth - 1, alpha, beta, not maximizing_player, 1)
+    except SearchTimeout:
+        return move, None, False, worker_ai.nodes
+
+    # A score at or beyond the bound only says the move is no better than the best one
+    exact = (score > alpha) if maximizing_player else (score < beta)
+    if exact:
+        with worker_bound.get_lock():
+            if (score > worker_bound.value) if maximizing_player else (score < worker_bound.value):
+                worker_bound.value = score
+    return move, score, exact, worker_ai.nodes
+
+def rollout_position(position):
+    # Plays one random game from a packed position in a worker; the score is positive for white
+    board = ChessBoard.unpack(position)
+    return worker_ai.simulate(board, board.turn)
@@ -1,10 +1,9 @@
 import pygame
+import importlib.util
 import os
-from chess import ChessBoard, ChessPiece, Pawn, Rook, Knight, Bishop, Queen, King
-import random
-import time
-from enum import Enum
-import math
+import threading
+from chess import ChessBoard, Pawn, Rook, Knight, Bishop, Queen, King
+from chess_ai import ChessAI, Difficulty, ROLLOUT_BATCH
 
 # Initialize Pygame
 pygame.init()
@@ -53,10 +52,12 @@ PIECE_IMAGES = load_piece_images()
 MOVE_SOUND = pygame.mixer.Sound('move.mp3')
 CAPTURE_SOUND = pygame.mixer.Sound('capture.mp3')
 
-class Difficulty(Enum):
-    EASY = 1
-    MEDIUM = 2
-    HARD = 3
+# Opening book used by the AI when present, see book.py
+BOOK_PATH = 'book.bin'
+TABLEBASE_PATH = 'tablebases'
+
+# Posted by the search thread when the AI has chosen its move
+AI_MOVE_EVENT = pygame.USEREVENT + 1
 
 
 class ChessGui:
@@ -69,6 +70,10 @@ class ChessGui:
         self.game_state = 'ongoing'
         self.ai = None
         self.ai_move_delay = 1.0  # Delay for AI moves in seconds
+        self.search_thread = None  # Thread using the AI, for a search or for pondering
+        self.search_stop = None
+        self.pondering = False
+        self.ponder_enabled = True  # Let the AI think while the player chooses a move
 
     def draw_board(self):
         for row in range(8):
@@ -114,11 +119,12 @@ class ChessGui:
                     return
             
             if self.board.is_valid_move(start, end):
-                self.board.move_piece(start, end, check_only=False)
-                piece = self.board.board[row][col]
+                promotion = None
+                piece = self.board.board[start[1]][start[0]]
                 if isinstance(piece, Pawn):
                     if (piece.color == 'white' and row == 7) or (piece.color == 'black' and row == 0):
-                        self.promote_pawn(col, row)
+                        promotion = self.promote_pawn(col, row, piece.color)
+                self.board.move_piece(start, end, check_only=False, promotion=promotion)
                 self.move_history.append((start, end))
                 if self.board.board[row][col] != ' ':
                     CAPTURE_SOUND.play()
@@ -135,27 +141,98 @@ class ChessGui:
         self.current_player = 'black' if self.current_player == 'white' else 'white'
         self.game_state = self.board.get_game_state(self.current_player)
         if self.game_mode == '1 Player' and self.current_player == 'black':
+            if self.pondering and self.resolve_ponder():
+                return
             # Use pygame.time.set_timer to schedule the AI move
             pygame.time.set_timer(pygame.USEREVENT, int(self.ai_move_delay * 1000))
 
-    def ai_move(self):
+    def start_ai_thread(self, target, pondering=False):
+        # Only one thread may use the AI at a time, so a cancelled one is waited for first
+        previous = self.search_thread
+        stop = threading.Event()
+
+        def run():
+            if previous is not None:
+                previous.join()
+            target(stop)
+
+        self.search_stop = stop
+        self.pondering = pondering
+        self.search_thread = threading.Thread(target=run, daemon=True)
+        self.search_thread.start()
+
+    def start_ai_search(self):
+        # The search runs on a copy of the board so the window keeps drawing the real one
+        board = self.board.copy()
+        color = self.current_player
+
+        def search(stop):
+            move = self.ai.get_best_move(board, color, stop)
+            if not stop.is_set():
+                pygame.event.post(pygame.event.Event(AI_MOVE_EVENT, move=move, stop=stop))
+
+        self.start_ai_thread(search)
+
+    def start_ponder(self):
+        board = self.board.copy()
+
+        def ponder(stop):
+            # Only posts a move when the player's reply was a ponder hit
+            move = self.ai.ponder(board, stop)
+            if move is not None and not stop.is_set():
+                pygame.event.post(pygame.event.Event(AI_MOVE_EVENT, move=move, stop=stop))
+
+        self.start_ai_thread(ponder, pondering=True)
+
+    def resolve_ponder(self):
+        # Returns True when the ponder search answers the player's move
+        self.pondering = False
+        status, move = self.ai.ponder_hit(self.board)
+        if status == 'miss':
+            self.search_stop.set()
+            return False
+        if status == 'ready':
+            pygame.event.post(pygame.event.Event(AI_MOVE_EVENT, move=move, stop=self.search_stop))
+        return True
+
+    def cancel_ai_search(self):
+        pygame.time.set_timer(pygame.USEREVENT, 0)
+        if self.search_stop:
+            self.search_stop.set()
+        self.search_stop = None
+        self.pondering = False
+
+    def is_ai_thinking(self):
+        return self.search_stop is not None and self.search_thread.is_alive()
+
+    def ai_move(self, move):
+        self.search_stop = None
+        if move:
+            start, end = move[0], move[1]
+            promotion = move[2] if len(move) > 2 else None
+            if self.board.move_piece(start, end, check_only=False, promotion=promotion):
+                self.move_history.append((start, end))
+
+                if self.board.board[end[1]][end[0]] != ' ':
+                    CAPTURE_SOUND.play()
+                else:
+                    MOVE_SOUND.play()
+                self.switch_player()
+                if self.ponder_enabled and self.game_state not in ('checkmate', 'stalemate'):
+                    self.start_ponder()
+
+    def new_game(self):
+        self.cancel_ai_search()
+        self.board = ChessBoard()
+        self.selected_piece = None
+        self.current_player = 'white'
+        self.move_history = []
+        self.game_state = 'ongoing'
         if self.ai:
-            start, end = self.ai.get_best_move(self.board, self.current_player)
-            if start and end:
-                if self.board.move_piece(start, end, check_only=False):
-                    self.move_history.append((start, end))
-                    
-                    # Check for pawn promotion
-                    piece = self.board.board[end[1]][end[0]]
-                    if isinstance(piece, Pawn):
-                        if (piece.color == 'white' and end[1] == 7) or (piece.color == 'black' and end[1] == 0):
-                            self.board.board[end[1]][end[0]] = Queen(piece.color)
-                    
-                    if self.board.board[end[1]][end[0]] != ' ':
-                        CAPTURE_SOUND.play()
-                    else:
-                        MOVE_SOUND.play()
-                    self.switch_player()
+            # The cancelled search still uses the AI until it notices the stop event
+            if self.search_thread is not None:
+                self.search_thread.join()
+            self.ai.reset()
 
     def handle_castling(self, start, end):
         king = self.board.board[start[1]][start[0]]
@@ -165,11 +242,9 @@ class ChessGui:
         # Determine if it's kingside or queenside castling
         if end[0] > start[0]:  # Kingside
             rook_start = (7, start[1])
-            rook_end = (5, start[1])
             king_end = (6, start[1])
         else:  # Queenside
             rook_start = (0, start[1])
-            rook_end = (3, start[1])
             king_end = (2, start[1])
 
         rook = self.board.board[rook_start[1]][rook_start[0]]
@@ -180,20 +255,15 @@ class ChessGui:
         if not self.board.is_castling_legal(start, king_end):
             return False
 
-        # Perform the castling move
-        self.board.board[king_end[1]][king_end[0]] = king
-        self.board.board[start[1]][start[0]] = ' '
-        self.board.board[rook_end[1]][rook_end[0]] = rook
-        self.board.board[rook_start[1]][rook_start[0]] = ' '
-        king.has_moved = True
-        rook.has_moved = True
+        # Perform the castling move; the board hops the rook over the king
+        if not self.board.move_piece(start, king_end):
+            return False
 
         MOVE_SOUND.play()
         return True
 
-    def promote_pawn(self, col, row):
+    def promote_pawn(self, col, row, piece_color):
         promotion_pieces = [Queen, Rook, Bishop, Knight]
-        piece_color = self.board.board[row][col].color
         
         # Calculate dimensions for promotion options
         original_size = int(SQUARE_SIZE * 0.54)  # 54% of the square size
@@ -233,15 +303,11 @@ class ChessGui:
                         for i in range(len(promotion_pieces)):
                             option_x = start_x + i * (option_width + padding)
                             if option_x <= click_pos[0] < option_x + option_width:
-                                new_piece = promotion_pieces[i](piece_color)
-                                self.board.board[row][col] = new_piece
+                                chosen_piece = promotion_pieces[i]
                                 waiting_for_promotion = False
                                 break
-        
-        # Redraw the board to show the promoted piece
-        self.draw_board()
-        self.draw_pieces()
-        pygame.display.flip()
+
+        return chosen_piece
 
     def draw_selection_screen(self):
         SCREEN.fill(WHITE)
@@ -304,6 +370,21 @@ class ChessGui:
         clear_rect = pygame.Rect(BOARD_SIZE + 10, HEIGHT - 60, WIDTH - BOARD_SIZE - 20, 60)
         pygame.draw.rect(SCREEN, WHITE, clear_rect)
 
+        # The thinking indicator sits above the game state text
+        thinking_rect = pygame.Rect(BOARD_SIZE + 10, HEIGHT - 115, WIDTH - BOARD_SIZE - 20, 55)
+        pygame.draw.rect(SCREEN, WHITE, thinking_rect)
+        if self.is_ai_thinking():
+            info = self.ai.search_info()
+            title = "Pondering..." if self.pondering else "Thinking..."
+            if info['iterations']:
+                progress = f"{info['iterations']} playouts"
+            elif info['depth']:
+                title, progress = f"{title} d{info['depth']}", f"{info['nodes']} nodes"
+            else:
+                progress = ""
+            SCREEN.blit(SMALL_FONT.render(title, True, BLACK), (BOARD_SIZE + 10, HEIGHT - 110))
+            SCREEN.blit(SMALL_FONT.render(progress, True, BLACK), (BOARD_SIZE + 10, HEIGHT - 85))
+
         if self.game_state == 'check' or self.game_state in ['checkmate', 'stalemate']:
             if self.game_state == 'check':
                 game_state_text = f"{self.current_player.capitalize()} is in check!"
@@ -347,326 +428,43 @@ class ChessGui:
                             button_y = start_y + i * (button_height + 20)
                             button_rect = pygame.Rect(button_x, button_y, button_width, button_height)
                             if button_rect.collidepoint(x, y):
-                                difficulty = i + 2  # Easy: 2, Medium: 3, Hard: 4
-                                self.ai = ChessAI(difficulty)
+                                difficulty = list(Difficulty)[i]
+                                self.ai = ChessAI(difficulty,
+                                                  book_path=BOOK_PATH if os.path.exists(BOOK_PATH) else None,
+                                                  tablebase_path=TABLEBASE_PATH if os.path.isdir(TABLEBASE_PATH) else None,
+                                                  rollout_batch=ROLLOUT_BATCH if importlib.util.find_spec('numpy') else 0)
                                 difficulty_selected = True
                                 break
             else:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
                         running = False
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_n:
+                        self.new_game()
                     elif event.type == pygame.MOUSEBUTTONDOWN:
-                        if self.game_state != 'checkmate' and self.game_state != 'stalemate':
+                        ai_to_move = self.game_mode == '1 Player' and self.current_player == 'black'
+                        if self.game_state != 'checkmate' and self.game_state != 'stalemate' and not ai_to_move:
                             pos = pygame.mouse.get_pos()
                             if pos[0] < BOARD_SIZE:
                                 self.handle_click(pos)
                     elif event.type == pygame.USEREVENT:
-                        # AI move event
+                        # Time to start the AI's search
                         pygame.time.set_timer(pygame.USEREVENT, 0)  # Stop the timer
-                        self.ai_move()
+                        self.start_ai_search()
+                    elif event.type == AI_MOVE_EVENT:
+                        # Results of cancelled searches are dropped
+                        if not event.stop.is_set():
+                            self.ai_move(event.move)
 
                 self.draw()
 
             pygame.display.flip()
 
+        self.cancel_ai_search()
+        if self.ai:
+            self.ai.close()
         pygame.quit()
 
-class MCTSNode:
-    def __init__(self, board, move=None, parent=None):
-        self.board = board
-        self.move = move
-        self.parent = parent
-        self.children = []
-        self.visits = 0
-        self.score = 0
-
-class ChessAI:
-    def __init__(self, difficulty):
-        self.difficulty = difficulty
-        self.max_thinking_time = 5  # Maximum thinking time in seconds
-        self.current_board = None
-        self.max_depth = 2 if difficulty == Difficulty.MEDIUM else 4 if difficulty == Difficulty.HARD else 1
-        self.exploration_constant = 1.41  # UCT exploration constant
-
-    def get_best_move(self, board, color):
-        self.current_board = board
-        self.current_color = color
-        moves = self.get_all_valid_moves(color)
-        
-        if not moves:
-            return None
-
-        if self.difficulty == Difficulty.EASY:
-            return random.choice(moves)
-        elif self.difficulty == Difficulty.MEDIUM:
-            return self.get_best_move_minimax(board, color)
-        else:  # HARD
-            return self.get_best_move_mcts(board, color)
-    
-    def get_best_move_minimax(self, board, color):
-        best_score = float('-inf') if color == 'white' else float('inf')
-        best_move = None
-        
-        for move in self.get_all_valid_moves(color):
-            new_board = ChessBoard()
-            new_board.board = [row[:] for row in board.board]
-            new_board.move_piece(move[0], move[1], check_only=False)
-            score = self.minimax(new_board, self.max_depth - 1, float('-inf'), float('inf'), color == 'black')
-            
-            if color == 'white':
-                if score > best_score:
-                    best_score = score
-                    best_move = move
-            else:
-                if score < best_score:
-                    best_score = score
-                    best_move = move
-        
-        return best_move
-    
-
-    def minimax(self, board, depth, alpha, beta, maximizing_player):
-        if depth == 0 or board.get_game_state('white' if maximizing_player else 'black') != 'ongoing':
-            return self.simulate(board, 'white' if maximizing_player else 'black')
-        
-        if maximizing_player:
-            max_eval = float('-inf')
-            for move in self.get_all_valid_moves('white'):
-                new_board = ChessBoard()
-                new_board.board = [row[:] for row in board.board]
-                new_board.move_piece(move[0], move[1], check_only=False)
-                eval = self.minimax(new_board, depth - 1, alpha, beta, False)
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for move in self.get_all_valid_moves('black'):
-                new_board = ChessBoard()
-                new_board.board = [row[:] for row in board.board]
-                new_board.move_piece(move[0], move[1], check_only=False)
-                eval = self.minimax(new_board, depth - 1, alpha, beta, True)
-                min_eval = min(min_eval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break
-            return min_eval
-        
-    def get_best_move_mcts(self, board, color):
-        root = MCTSNode(board)
-        end_time = time.time() + self.max_thinking_time
-
-        while time.time() < end_time:
-            leaf = self.select(root)
-            child = self.expand(leaf, color)
-            result = self.simulate(child.board, color)
-            self.backpropagate(child, result)
-
-        best_child = max(root.children, key=lambda c: c.visits)
-        return best_child.move
-
-    def select(self, node):
-        while node.children:
-            if not all(child.visits > 0 for child in node.children):
-                return self.expand(node, self.current_color)
-            node = self.uct_select(node)
-        return node
-
-    def expand(self, node, color):
-        moves = self.get_all_valid_moves(color)
-        for move in moves:
-            new_board = ChessBoard()  # Create a new ChessBoard instance
-            new_board.board = [row[:] for row in node.board.board]  # Copy the board state
-            new_board.move_piece(move[0], move[1], check_only=False)
-            child = MCTSNode(new_board, move, node)
-            node.children.append(child)
-        return random.choice(node.children) if node.children else None
-
-    def simulate(self, board, color):
-        temp_board = ChessBoard()  # Create a new ChessBoard instance
-        temp_board.board = [row[:] for row in board.board]  # Copy the board state
-        current_color = color
-        max_moves = 100  # Prevent infinite games
-
-        for _ in range(max_moves):
-            if temp_board.get_game_state(current_color) != 'ongoing':
-                break
-            moves = self.get_all_valid_moves(current_color)
-            if not moves:
-                break
-            move = random.choice(moves)
-            temp_board.move_piece(move[0], move[1], check_only=False)
-            current_color = 'black' if current_color == 'white' else 'white'
-
-        return self.evaluate_board(temp_board)
-    
-
-    def evaluate_board(self, board):
-        if board.get_game_state('white') == 'checkmate':
-            return -1000  # Black wins
-        elif board.get_game_state('black') == 'checkmate':
-            return 1000  # White wins
-        elif board.get_game_state('white') == 'stalemate' or board.get_game_state('black') == 'stalemate':
-            return 0  # Draw
-
-        score = 0
-        piece_values = {
-            Pawn: 100, Knight: 320, Bishop: 330, Rook: 500, Queen: 900, King: 20000
-        }
-
-        # Piece square tables for positional scoring
-        piece_position_tables = {
-            Pawn: [
-                0,  0,  0,  0,  0,  0,  0,  0,
-                50, 50, 50, 50, 50, 50, 50, 50,
-                10, 10, 20, 30, 30, 20, 10, 10,
-                5,  5, 10, 25, 25, 10,  5,  5,
-                0,  0,  0, 20, 20,  0,  0,  0,
-                5, -5,-10,  0,  0,-10, -5,  5,
-                5, 10, 10,-20,-20, 10, 10,  5,
-                0,  0,  0,  0,  0,  0,  0,  0
-            ],
-            Knight: [
-                -50,-40,-30,-30,-30,-30,-40,-50,
-                -40,-20,  0,  0,  0,  0,-20,-40,
-                -30,  0, 10, 15, 15, 10,  0,-30,
-                -30,  5, 15, 20, 20, 15,  5,-30,
-                -30,  0, 15, 20, 20, 15,  0,-30,
-                -30,  5, 10, 15, 15, 10,  5,-30,
-                -40,-20,  0,  5,  5,  0,-20,-40,
-                -50,-40,-30,-30,-30,-30,-40,-50,
-            ],
-            Bishop: [
-                -20,-10,-10,-10,-10,-10,-10,-20,
-                -10,  0,  0,  0,  0,  0,  0,-10,
-                -10,  0,  5, 10, 10,  5,  0,-10,
-                -10,  5,  5, 10, 10,  5,  5,-10,
-                -10,  0, 10, 10, 10, 10,  0,-10,
-                -10, 10, 10, 10, 10, 10, 10,-10,
-                -10,  5,  0,  0,  0,  0,  5,-10,
-                -20,-10,-10,-10,-10,-10,-10,-20,
-            ],
-            Rook: [
-                0,  0,  0,  0,  0,  0,  0,  0,
-                5, 10, 10, 10, 10, 10, 10,  5,
-                -5,  0,  0,  0,  0,  0,  0, -5,
-                -5,  0,  0,  0,  0,  0,  0, -5,
-                -5,  0,  0,  0,  0,  0,  0, -5,
-                -5,  0,  0,  0,  0,  0,  0, -5,
-                -5,  0,  0,  0,  0,  0,  0, -5,
-                0,  0,  0,  5,  5,  0,  0,  0
-            ],
-            Queen: [
-                -20,-10,-10, -5, -5,-10,-10,-20,
-                -10,  0,  0,  0,  0,  0,  0,-10,
-                -10,  0,  5,  5,  5,  5,  0,-10,
-                -5,  0,  5,  5,  5,  5,  0, -5,
-                0,  0,  5,  5,  5,  5,  0, -5,
-                -10,  5,  5,  5,  5,  5,  0,-10,
-                -10,  0,  5,  0,  0,  0,  0,-10,
-                -20,-10,-10, -5, -5,-10,-10,-20
-            ],
-            King: [
-                -30,-40,-40,-50,-50,-40,-40,-30,
-                -30,-40,-40,-50,-50,-40,-40,-30,
-                -30,-40,-40,-50,-50,-40,-40,-30,
-                -30,-40,-40,-50,-50,-40,-40,-30,
-                -20,-30,-30,-40,-40,-30,-30,-20,
-                -10,-20,-20,-20,-20,-20,-20,-10,
-                20, 20,  0,  0,  0,  0, 20, 20,
-                20, 30, 10,  0,  0, 10, 30, 20
-            ]
-        }
-
-        for row in range(8):
-            for col in range(8):
-                piece = board.board[row][col]
-                if piece != ' ':
-                    piece_type = type(piece)
-                    piece_value = piece_values[piece_type]
-                    position_value = piece_position_tables[piece_type][row * 8 + col]
-                    
-                    if piece.color == 'white':
-                        score += piece_value + position_value
-                    else:
-                        score -= piece_value + position_value
-
-        # Evaluate pawn structure
-        for col in range(8):
-            white_pawns = sum(1 for row in range(8) if isinstance(board.board[row][col], Pawn) and board.board[row][col].color == 'white')
-            black_pawns = sum(1 for row in range(8) if isinstance(board.board[row][col], Pawn) and board.board[row][col].color == 'black')
-            
-            if white_pawns > 1:
-                score -= 10 * (white_pawns - 1)  # Penalize doubled pawns
-            if black_pawns > 1:
-                score += 10 * (black_pawns - 1)  # Penalize doubled pawns
-
-        # Evaluate control of the center
-        center_squares = [(3,3), (3,4), (4,3), (4,4)]
-        for row, col in center_squares:
-            piece = board.board[row][col]
-            if piece != ' ':
-                if piece.color == 'white':
-                    score += 10
-                else:
-                    score -= 10
-
-        # Evaluate king safety
-        white_king_pos = next((i, j) for i, row in enumerate(board.board) for j, piece in enumerate(row) if isinstance(piece, King) and piece.color == 'white')
-        black_king_pos = next((i, j) for i, row in enumerate(board.board) for j, piece in enumerate(row) if isinstance(piece, King) and piece.color == 'black')
-
-        # Penalize if kings are not in their starting positions (assuming they haven't castled)
-        if white_king_pos != (0, 4):
-            score -= 20
-        if black_king_pos != (7, 4):
-            score += 20
-
-        # Evaluate piece development (encourage pieces to move from their starting positions)
-        if isinstance(board.board[0][1], Knight):
-            score -= 10
-        if isinstance(board.board[0][6], Knight):
-            score -= 10
-        if isinstance(board.board[7][1], Knight):
-            score += 10
-        if isinstance(board.board[7][6], Knight):
-            score += 10
-
-        if isinstance(board.board[0][2], Bishop):
-            score -= 10
-        if isinstance(board.board[0][5], Bishop):
-            score -= 10
-        if isinstance(board.board[7][2], Bishop):
-            score += 10
-        if isinstance(board.board[7][5], Bishop):
-            score += 10
-
-        return score
-
-    def backpropagate(self, node, result):
-        while node is not None:
-            node.visits += 1
-            if result is not None:  # Add this check
-                node.score += result
-            node = node.parent
-
-    def uct_select(self, node):
-        return max(node.children, key=lambda c: c.score / c.visits + 
-                   self.exploration_constant * math.sqrt(math.log(node.visits) / c.visits))
-
-    def get_all_valid_moves(self, color):
-        moves = []
-        for row in range(8):
-            for col in range(8):
-                piece = self.current_board.board[row][col]
-                if piece != ' ' and piece.color == color:
-                    for end_row in range(8):
-                        for end_col in range(8):
-                            if self.current_board.is_valid_move((col, row), (end_col, end_row)):
-                                moves.append(((col, row), (end_col, end_row)))
-        return moves
-
 if __name__ == "__main__":
     chess_gui = ChessGui()
     chess_gui.run()
@@ -0,0 +1,229 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess import ChessBoard
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"(.*)"\]')
+# Comments, variations, numeric annotation glyphs and move numbers carry no moves
+MOVETEXT_NOISE = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?')
+SHARDS_PER_WORKER = 4
+
+
+def strip_variations(text):
+    depth = 0
+    kept = []
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            kept.append(char)
+    return ''.join(kept)
+
+
+def parse_movetext(text):
+    # SAN tokens of the main line and the result token, if any
+    text = strip_variations(MOVETEXT_NOISE.sub(' ', text))
+    tokens = text.split()
+    result = '*'
+    if tokens and tokens[-1] in RESULTS:
+        result = tokens.pop()
+    return tokens, result
+
+
+def last_line_before(pgn_file, position):
+    # The last non-blank line that ends before `position`, which must be the start of a line
+    window = 256
+    while True:
+        begin = max(0, position - window)
+        pgn_file.seek(begin)
+        lines = pgn_file.read(position - begin).split(b'\n')
+        if begin > 0:
+            lines = lines[1:]  # May start in the middle of a line
+        for line in reversed(lines):
+            if line.strip():
+                return line
+        if begin == 0:
+            return b''
+        window *= 2
+
+
+def iter_games(pgn_file, start=0, end=None):
+    # Yields (offset, tags, movetext lines) for each game of a binary file that starts in
+    # [start, end). A game starts at a tag line whose previous non-blank line is not a tag, so
+    # shard boundaries can fall anywhere: each game is read by the shard holding its first line.
+    position = start
+    if start > 0:
+        pgn_file.seek(start - 1)
+        position = start - 1 + len(pgn_file.readline())
+    in_tags = last_line_before(pgn_file, position).lstrip().startswith(b'[') if position > 0 else False
+    pgn_file.seek(position)
+    # A shard starting at 0 owns any moves before the first tags
+    game_offset = 0 if start == 0 else None
+    tags, movetext = {}, []
+    for line in iter(pgn_file.readline, b''):
+        line_offset = position
+        position += len(line)
+        text = line.decode('utf-8', errors='replace').strip()
+        if not text:
+            continue
+        is_tag = text.startswith('[')
+        if is_tag and not in_tags:
+            if game_offset is not None and movetext:
+                yield game_offset, tags, movetext
+            if end is not None and line_offset >= end:
+                return
+            game_offset, tags, movetext = line_offset, {}, []
+        in_tags = is_tag
+        if game_offset is None:
+            continue  # The rest of a game owned by the previous shard
+        if is_tag:
+            match = TAG_PATTERN.match(text)
+            if match:
+                tags[match.group(1)] = match.group(2)
+        else:
+            movetext.append(text)
+    if game_offset is not None and movetext:
+        yield game_offset, tags, movetext
+
+
+def read_games(path, start=0, end=None):
+    # Yields (tags, san_moves, result) for each game in a PGN file, or in a byte range of it
+    with open(path, 'rb') as pgn_file:
+        for _, tags, movetext in iter_games(pgn_file, start, end):
+            yield (tags,) + parse_movetext(' '.join(movetext))
+
+
+def start_board(tags):
+    return ChessBoard.from_fen(tags['FEN']) if 'FEN' in tags else ChessBoard()
+
+
+def replay(tags, san_moves):
+    # Yields (board, move) before each move is played; stops at the first move that does not parse
+    try:
+        board = start_board(tags)
+    except ValueError:
+        return
+    for san in san_moves:
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            return
+        yield board, move
+        board.make_move(move)
+
+
+def check_game(tags, san_moves, result):
+    # Plays a game through the rules engine: the plies played, the final position, checkmate or
+    # stalemate if the game ends in one, and the first problem found
+    summary = {'plies': 0, 'result': result, 'fen': None, 'ending': None, 'error': None}
+    try:
+        board = start_board(tags)
+    except ValueError as error:
+        summary['error'] = str(error)
+        return summary
+    for san in san_moves:
+        try:
+            move = board.parse_san(san)
+        except ValueError as error:
+            summary['error'] = f"ply {summary['plies'] + 1}: {error}"
+            break
+        board.make_move(move)
+        summary['plies'] += 1
+    else:
+        if not any(True for _ in board.iter_legal_moves(board.turn)):
+            if board.is_king_in_check(board.turn):
+                summary['ending'] = 'checkmate'
+                winner = '0-1' if board.turn == 'white' else '1-0'
+                if result not in (winner, '*'):
+                    summary['error'] = f"result {result} after {winner} checkmate"
+            else:
+                summary['ending'] = 'stalemate'
+                if result in ('1-0', '0-1'):
+                    summary['error'] = f"result {result} after stalemate"
+    summary['fen'] = board.to_fen()
+    return summary
+
+
+def validate_games(path, start=0, end=None):
+    # Yields the check_game summary of each game in a file or byte range, with its byte offset
+    with open(path, 'rb') as pgn_file:
+        for offset, tags, movetext in iter_games(pgn_file, start, end):
+            summary = check_game(tags, *parse_movetext(' '.join(movetext)))
+            summary['offset'] = offset
+            yield summary
+
+
+def validate_shard(path, start, end):
+    # Worker task: (games, plies, summaries of the games with errors) for one byte range
+    games = plies = 0
+    errors = []
+    for summary in validate_games(path, start, end):
+        games += 1
+        plies += summary['plies']
+        if summary['error']:
+            errors.append(summary)
+    return games, plies, errors
+
+
+def shard_ranges(path, shards):
+    size = os.path.getsize(path)
+    bounds = [size * i // shards for i in range(shards + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def validate_file(path, workers=1):
+    # (games, plies, error summaries); more than one worker splits the file by byte ranges
+    if workers <= 1:
+        return validate_shard(path, 0, None)
+    ranges = shard_ranges(path, workers * SHARDS_PER_WORKER)
+    games = plies = 0
+    errors = []
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(validate_shard, path, start, end) for start, end in ranges]
+        for future in futures:
+            shard_games, shard_plies, shard_errors = future.result()
+            games += shard_games
+            plies += shard_plies
+            errors.extend(shard_errors)
+    return games, plies, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pgn', description="Check PGN files against the rules engine.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    validate_parser = subparsers.add_parser('validate', help="replay every game and report problems")
+    validate_parser.add_argument('pgn', nargs='+')
+    validate_parser.add_argument('--workers', type=int, default=1, help="processes sharing each file")
+    validate_parser.add_argument('--quiet', action='store_true', help="only print the totals")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'validate':
+        total_games = total_plies = total_errors = 0
+        start_time = time.perf_counter()
+        for path in args.pgn:
+            games, plies, errors = validate_file(path, args.workers)
+            total_games += games
+            total_plies += plies
+            total_errors += len(errors)
+            if not args.quiet:
+                for summary in errors:
+                    print(f"{path}@{summary['offset']}: {summary['error']}")
+        elapsed = time.perf_counter() - start_time
+        print(f"Games: {total_games}")
+        print(f"Plies: {total_plies}")
+        print(f"Errors: {total_errors}")
+        print(f"Time: {elapsed:.3f}s")
+        print(f"Games per second: {total_games / elapsed if elapsed else 0:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
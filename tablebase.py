@@ -0,0 +1,428 @@
+import argparse
+import mmap
+import os
+import time
+from array import array
+from itertools import combinations_with_replacement
+
+from chess import (ChessBoard, King, Queen, Rook, Bishop, Knight, Pawn, PIECE_VALUES, KNIGHT_TARGETS,
+                   KING_TARGETS, RAYS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, QUEEN_DIRECTIONS, STARTING_FEN)
+
+# Squares are numbered y * 8 + x. Each table stores one byte per position: the result for the
+# side to move in the low two bits and the distance to mate in moves in the upper six.
+DRAW, WIN, LOSS, INVALID = 0, 1, 2, 3
+MAX_PIECES = 4
+MAX_DTM = 63
+PIECE_LETTERS = {'K': King, 'Q': Queen, 'R': Rook, 'B': Bishop, 'N': Knight}
+LETTER_ORDER = 'KQRBN'
+
+KNIGHT_JUMPS = [[y * 8 + x for x, y in KNIGHT_TARGETS[(s % 8, s // 8)]] for s in range(64)]
+KING_STEPS = [[y * 8 + x for x, y in KING_TARGETS[(s % 8, s // 8)]] for s in range(64)]
+KNIGHT_SETS = [set(targets) for targets in KNIGHT_JUMPS]
+KING_SETS = [set(targets) for targets in KING_STEPS]
+RAY_SQUARES = [{direction: [y * 8 + x for x, y in RAYS[(s % 8, s // 8)][direction]] for direction in QUEEN_DIRECTIONS}
+               for s in range(64)]
+SLIDER_DIRECTIONS = {Queen: QUEEN_DIRECTIONS, Rook: ROOK_DIRECTIONS, Bishop: BISHOP_DIRECTIONS}
+# For two aligned squares: whether the line is diagonal, and the squares in between
+LINES = [{} for _ in range(64)]
+for _s in range(64):
+    for _direction, _ray in RAY_SQUARES[_s].items():
+        for _i, _target in enumerate(_ray):
+            LINES[_s][_target] = (_direction in BISHOP_DIRECTIONS, _ray[:_i])
+
+
+def _transform(s, flip_x, flip_y, swap):
+    x, y = s % 8, s // 8
+    if flip_x:
+        x = 7 - x
+    if flip_y:
+        y = 7 - y
+    if swap:
+        x, y = y, x
+    return y * 8 + x
+
+# Without pawns or castling the board has eight symmetries; the white king is kept in a1-d1-d4
+TRANSFORMS = [[_transform(s, flip_x, flip_y, swap) for s in range(64)]
+              for flip_x in (False, True) for flip_y in (False, True) for swap in (False, True)]
+TRIANGLE = [s for s in range(64) if s % 8 <= 3 and s // 8 <= s % 8]
+TRIANGLE_INDEX = {s: i for i, s in enumerate(TRIANGLE)}
+KING_TRANSFORMS = [[transform for transform in TRANSFORMS if transform[s] in TRIANGLE_INDEX] for s in range(64)]
+
+
+def piece_targets(piece_class, square, occupied):
+    # Squares the piece moves to or captures on, blockers included
+    if piece_class is Knight:
+        return KNIGHT_JUMPS[square]
+    if piece_class is King:
+        return KING_STEPS[square]
+    targets = []
+    for direction in SLIDER_DIRECTIONS[piece_class]:
+        for target in RAY_SQUARES[square][direction]:
+            targets.append(target)
+            if target in occupied:
+                break
+    return targets
+
+def attacks(piece_class, square, target, occupied):
+    if piece_class is Knight:
+        return target in KNIGHT_SETS[square]
+    if piece_class is King:
+        return target in KING_SETS[square]
+    line = LINES[square].get(target)
+    if line is None:
+        return False
+    diagonal, between = line
+    if piece_class is Rook and diagonal or piece_class is Bishop and not diagonal:
+        return False
+    return not any(s in occupied for s in between)
+
+
+def parse_material(name):
+    white, black = name.upper().split('V')
+    return white, black
+
+def side_strength(letters):
+    return (sum(PIECE_VALUES[PIECE_LETTERS[letter]] for letter in letters), letters)
+
+def canonical_material(white, black):
+    # Table name for the pieces of each side, and whether colours are swapped to reach it
+    white = ''.join(sorted(white, key=LETTER_ORDER.index))
+    black = ''.join(sorted(black, key=LETTER_ORDER.index))
+    if side_strength(black) > side_strength(white):
+        return f'{black}v{white}', True
+    return f'{white}v{black}', False
+
+def all_materials(max_pieces=MAX_PIECES):
+    # Every pawnless material set with three to max_pieces pieces, smaller sets first
+    names = []
+    for extra in range(1, max_pieces - 1):
+        for total_white in range(extra, 0, -1):
+            for white in combinations_with_replacement('QRBN', total_white):
+                for black in combinations_with_replacement('QRBN', extra - total_white):
+                    name, _ = canonical_material('K' + ''.join(white), 'K' + ''.join(black))
+                    if name not in names:
+                        names.append(name)
+    return names
+
+
+class Tablebase:
+    def __init__(self, name, data=None):
+        white, black = parse_material(name)
+        self.name = f'{white}v{black}'
+        self.types = [PIECE_LETTERS[letter] for letter in white + black]
+        self.colors = ['white'] * len(white) + ['black'] * len(black)
+        self.count = len(self.types)
+        self.kings = {'white': 0, 'black': len(white)}
+        self.size = 2 * len(TRIANGLE) * 64 ** (self.count - 1)
+        # Runs of identical pieces; their squares are kept sorted so each position has one index
+        self.groups = []
+        start = 0
+        for i in range(1, self.count + 1):
+            if i == self.count or self.types[i] is not self.types[start] or self.colors[i] != self.colors[start]:
+                if i - start > 1:
+                    self.groups.append((start, i))
+                start = i
+        self.data = data
+        self.file = None
+
+    @classmethod
+    def open(cls, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        table_file = open(path, 'rb')
+        table = cls(name, mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ))
+        table.file = table_file
+        if len(table.data) != table.size:
+            table.close()
+            raise ValueError(f"{path} has {len(table.data)} bytes, expected {table.size}")
+        return table
+
+    def close(self):
+        if self.file:
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+    def canonical(self, squares):
+        best = None
+        for transform in KING_TRANSFORMS[squares[0]]:
+            mapped = [transform[s] for s in squares]
+            for start, end in self.groups:
+                mapped[start:end] = sorted(mapped[start:end])
+            if best is None or mapped < best:
+                best = mapped
+        return best
+
+    def index(self, turn, squares):
+        # `squares` must be canonical
+        index = (0 if turn == 'white' else len(TRIANGLE)) + TRIANGLE_INDEX[squares[0]]
+        for s in squares[1:]:
+            index = index * 64 + s
+        return index
+
+    def decode(self, index):
+        squares = []
+        for _ in range(self.count - 1):
+            index, s = divmod(index, 64)
+            squares.append(s)
+        turn = 'white' if index < len(TRIANGLE) else 'black'
+        squares.append(TRIANGLE[index % len(TRIANGLE)])
+        return turn, squares[::-1]
+
+    def probe(self, turn, squares):
+        # (result, plies to mate) for the side to move
+        value = self.data[self.index(turn, self.canonical(squares))]
+        result, moves = value & 3, value >> 2
+        if result == WIN:
+            return WIN, 2 * moves - 1
+        if result == LOSS:
+            return LOSS, 2 * moves
+        return result, 0
+
+    def in_check(self, turn, squares, captured=None):
+        king = squares[self.kings[turn]]
+        occupied = set(squares)
+        for i, s in enumerate(squares):
+            if i != captured and self.colors[i] != turn and attacks(self.types[i], s, king, occupied):
+                return True
+        return False
+
+    def legal_moves(self, turn, squares):
+        # (moving piece, target square, captured piece or None) for each legal move
+        occupied = {s: i for i, s in enumerate(squares)}
+        moves = []
+        for i in range(self.count):
+            if self.colors[i] != turn:
+                continue
+            for target in piece_targets(self.types[i], squares[i], occupied):
+                captured = occupied.get(target)
+                if captured is not None and self.colors[captured] == turn:
+                    continue
+                moved = list(squares)
+                moved[i] = target
+                if not self.in_check(turn, moved, captured):
+                    moves.append((i, target, captured))
+        return moves
+
+    def predecessors(self, turn, squares):
+        # Positions, other side to move, that reach this one by a move that captures nothing
+        mover = 'black' if turn == 'white' else 'white'
+        occupied = set(squares)
+        for i in range(self.count):
+            if self.colors[i] != mover:
+                continue
+            for origin in piece_targets(self.types[i], squares[i], occupied):
+                if origin in occupied:
+                    continue
+                moved = list(squares)
+                moved[i] = origin
+                if not self.in_check(turn, moved):
+                    yield moved
+
+
+def table_path(directory, name):
+    return os.path.join(directory, f'{name}.tb')
+
+def capture_tables(table, directory, log):
+    # For each capturable piece: the table of what is left and whether colours swap, or None for bare kings
+    tables = {}
+    for i in range(table.count):
+        if table.types[i] is King:
+            continue
+        white, black = parse_material(table.name)
+        letters = list(white + black)
+        del letters[i]
+        white_left = ''.join(letters[:len(white) - (table.colors[i] == 'white')])
+        black_left = ''.join(letters[len(white_left):])
+        if white_left == 'K' and black_left == 'K':
+            tables[i] = None
+            continue
+        name, swapped = canonical_material(white_left, black_left)
+        if not os.path.exists(table_path(directory, name)):
+            generate(name, directory, log)
+        tables[i] = (Tablebase.open(table_path(directory, name)), swapped)
+    return tables
+
+def probe_capture(table, capture_table, turn, squares, captured):
+    # Result for `turn` after a capture left the pieces in `squares` minus `captured`
+    if capture_table is None:
+        return DRAW, 0
+    sub_table, swapped = capture_table
+    left = squares[:captured] + squares[captured + 1:]
+    if swapped:
+        split = table.kings['black'] - (captured < table.kings['black'])
+        left = [s ^ 56 for s in left[split:] + left[:split]]
+        turn = 'black' if turn == 'white' else 'white'
+    return sub_table.probe(turn, left)
+
+def generate(name, directory, log=print):
+    # Retrograde analysis: mates first, then positions one ply further from mate at a time
+    table = Tablebase(name)
+    start_time = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    captures = capture_tables(table, directory, log)
+
+    UNUSED, UNKNOWN, RESOLVED = 0, 1, 2
+    state = bytearray(table.size)
+    data = bytearray([INVALID]) * table.size
+    remaining = array('B', bytes(table.size))  # Successors not yet known to win for the opponent
+    no_loss = bytearray(table.size)  # A draw or a winning capture is available
+    refuted_capture = {}  # Longest win the opponent has after one of our captures
+    wins = {}  # plies -> positions to mark as won
+    losses = {}
+
+    for index in range(table.size):
+        turn, squares = table.decode(index)
+        if len(set(squares)) < table.count or squares != table.canonical(squares):
+            continue
+        opponent = 'black' if turn == 'white' else 'white'
+        if table.in_check(opponent, squares):
+            continue
+        state[index] = UNKNOWN
+        data[index] = DRAW
+        moves = table.legal_moves(turn, squares)
+        if not moves:
+            if table.in_check(turn, squares):
+                losses.setdefault(0, []).append(index)
+            else:
+                state[index] = RESOLVED  # Stalemate
+            continue
+
+        successors = set()
+        for i, target, captured in moves:
+            moved = list(squares)
+            moved[i] = target
+            if captured is None:
+                successors.add(table.index(opponent, table.canonical(moved)))
+                continue
+            result, plies = probe_capture(table, captures[captured], opponent, moved, captured)
+            if result == LOSS:
+                wins.setdefault(plies + 1, []).append(index)
+                no_loss[index] = 1
+            elif result == WIN:
+                refuted_capture[index] = max(refuted_capture.get(index, 0), plies + 1)
+            else:
+                no_loss[index] = 1
+        remaining[index] = len(successors)
+        if not successors and not no_loss[index]:
+            losses.setdefault(refuted_capture[index], []).append(index)
+
+    ply = 0
+    while ply <= max(list(wins) + list(losses), default=-1):
+        for result, indexes in ((LOSS, losses.pop(ply, [])), (WIN, wins.pop(ply, []))):
+            for index in indexes:
+                if state[index] != UNKNOWN:
+                    continue
+                state[index] = RESOLVED
+                data[index] = result | min(MAX_DTM, (ply + 1) // 2) << 2
+                turn, squares = table.decode(index)
+                mover = 'black' if turn == 'white' else 'white'
+                for predecessor in {table.index(mover, table.canonical(moved))
+                                    for moved in table.predecessors(turn, squares)}:
+                    if state[predecessor] != UNKNOWN:
+                        continue
+                    if result == LOSS:
+                        wins.setdefault(ply + 1, []).append(predecessor)
+                        continue
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0 and not no_loss[predecessor]:
+                        plies = max(ply + 1, refuted_capture.get(predecessor, 0))
+                        losses.setdefault(plies, []).append(predecessor)
+        ply += 1
+
+    for capture_table in captures.values():
+        if capture_table:
+            capture_table[0].close()
+    with open(table_path(directory, table.name), 'wb') as table_file:
+        table_file.write(data)
+    log(f"{table.name}: {sum(state[i] != UNUSED for i in range(table.size))} positions, "
+        f"{time.perf_counter() - start_time:.1f}s")
+    return table.name
+
+
+class TablebaseProber:
+    # Looks up ChessBoard positions in the generated tables found in a directory
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.probes = 0
+        self.hits = 0
+
+    def table(self, name):
+        if name not in self.tables:
+            path = table_path(self.directory, name)
+            self.tables[name] = Tablebase.open(path) if os.path.exists(path) else None
+        return self.tables[name]
+
+    def close(self):
+        for table in self.tables.values():
+            if table:
+                table.close()
+        self.tables = {}
+
+    def probe(self, board):
+        # (result, plies to mate) for the side to move, or None when no table covers the position
+        if board.castling or len(board.piece_squares['white']) + len(board.piece_squares['black']) > MAX_PIECES:
+            return None
+        self.probes += 1
+        pieces = {'white': [], 'black': []}
+        for color in pieces:
+            for x, y in board.piece_squares[color]:
+                piece_class = type(board.board[y][x])
+                if piece_class is Pawn:
+                    return None
+                letter = next(letter for letter, cls in PIECE_LETTERS.items() if cls is piece_class)
+                pieces[color].append((LETTER_ORDER.index(letter), y * 8 + x, letter))
+            pieces[color].sort()
+        white = ''.join(letter for _, _, letter in pieces['white'])
+        black = ''.join(letter for _, _, letter in pieces['black'])
+        if white == 'K' and black == 'K':
+            self.hits += 1
+            return DRAW, 0
+        name, swapped = canonical_material(white, black)
+        table = self.table(name)
+        if table is None:
+            return None
+        turn = board.turn
+        if swapped:
+            squares = [s ^ 56 for _, s, _ in pieces['black'] + pieces['white']]
+            turn = 'black' if turn == 'white' else 'white'
+        else:
+            squares = [s for _, s, _ in pieces['white'] + pieces['black']]
+        self.hits += 1
+        return table.probe(turn, squares)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tablebase', description="Generate or probe endgame tablebases.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help="build tables by retrograde analysis")
+    generate_parser.add_argument('materials', nargs='*', help="material sets such as KQvK or KRvKB")
+    generate_parser.add_argument('--all', action='store_true', help="every pawnless set of 3 to 4 pieces")
+    generate_parser.add_argument('--directory', default='tablebases')
+
+    probe_parser = subparsers.add_parser('probe', help="look up a position")
+    probe_parser.add_argument('--fen', default=STARTING_FEN)
+    probe_parser.add_argument('--directory', default='tablebases')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for name in (all_materials() if args.all else args.materials):
+            name, _ = canonical_material(*parse_material(name))
+            if not os.path.exists(table_path(args.directory, name)):
+                generate(name, args.directory)
+    elif args.command == 'probe':
+        prober = TablebaseProber(args.directory)
+        result = prober.probe(ChessBoard.from_fen(args.fen))
+        if result is None:
+            print("Not in the tablebases")
+        else:
+            outcome, plies = result
+            print(['draw', 'win', 'loss', 'invalid position'][outcome] + (f" in {plies} plies" if plies else ""))
+        prober.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chess import ChessBoard, Pawn, Knight, Bishop, STARTING_FEN, move_to_uci
+from chess_ai import ChessAI, Difficulty
+
+MAX_PLIES = 300  # Longer games are scored as draws
+RANDOM_OPENING_PLIES = 4  # Random moves played before the engines take over, the same for both colours
+# Engine options: name -> (ChessAI attribute or constructor argument, parser)
+ENGINE_OPTIONS = {
+    'difficulty': ('difficulty', lambda value: Difficulty[value.upper()]),
+    'time': ('max_thinking_time', float),
+    'depth': ('max_depth', int),
+    'nodes': ('max_nodes', int),
+    'workers': ('workers', int),
+    'batch': ('rollout_batch', int),
+    'book': ('book_path', str),
+    'tablebases': ('tablebase_path', str),
+}
+CONSTRUCTOR_OPTIONS = ('workers', 'max_nodes', 'rollout_batch', 'book_path', 'tablebase_path')
+
+
+def parse_engine(text):
+    # "name:difficulty=medium,time=1,depth=4" -> (name, {option: value})
+    name, _, options = text.partition(':')
+    settings = {'difficulty': 'medium'}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key not in ENGINE_OPTIONS:
+            raise ValueError(f"Unknown engine option {key!r} in {text!r}")
+        settings[key] = value
+    return name, settings
+
+
+def create_engine(settings):
+    values = {ENGINE_OPTIONS[key][0]: ENGINE_OPTIONS[key][1](value) for key, value in settings.items()}
+    ai = ChessAI(values.pop('difficulty'), **{key: values.pop(key) for key in CONSTRUCTOR_OPTIONS if key in values})
+    for attribute, value in values.items():
+        setattr(ai, attribute, value)
+    return ai
+
+
+def random_opening(seed, plies=RANDOM_OPENING_PLIES, fen=STARTING_FEN):
+    # UCI moves of a random opening, so that colour-swapped pairs of games start alike
+    rng = random.Random(str(seed))
+    board = ChessBoard.from_fen(fen)
+    moves = []
+    for _ in range(plies):
+        legal = board.legal_moves(board.turn)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        moves.append(move_to_uci(move))
+        board.make_move(move)
+    return moves
+
+
+def insufficient_material(board):
+    pieces = [board.board[y][x] for color in ('white', 'black') for x, y in board.piece_squares[color]]
+    return len(pieces) == 2 or (len(pieces) == 3 and any(isinstance(piece, (Knight, Bishop)) for piece in pieces))
+
+
+def play_game(game, white, black, fen, opening, max_plies=MAX_PLIES):
+    # Plays one game between two (name, settings) engines; returns the JSON record of the game
+    board = ChessBoard.from_fen(fen)
+    for uci in opening:
+        move = next(move for move in board.legal_moves(board.turn) if move_to_uci(move) == uci)
+        board.make_move(move)
+    engines = {'white': create_engine(white[1]), 'black': create_engine(black[1])}
+    stats = {color: {'moves': 0, 'time': 0.0, 'nodes': 0} for color in engines}
+    seen = {board.zobrist_key: 1}
+    halfmoves = 0  # Plies since the last capture or pawn move
+    result, reason = '1/2-1/2', 'max plies'
+    moves = list(opening)
+    try:
+        for _ in range(max_plies - len(opening)):
+            color = board.turn
+            if not board.legal_moves(color):
+                if board.is_king_in_check(color):
+                    result, reason = ('0-1' if color == 'white' else '1-0'), 'checkmate'
+                else:
+                    reason = 'stalemate'
+                break
+            if insufficient_material(board):
+                reason = 'insufficient material'
+                break
+            if halfmoves >= 100:
+                reason = 'fifty moves'
+                break
+            ai = engines[color]
+            start_time = time.perf_counter()
+            move = ai.get_best_move(board, color)
+            stats[color]['time'] += time.perf_counter() - start_time
+            stats[color]['nodes'] += ai.nodes + ai.iterations
+            stats[color]['moves'] += 1
+
+            x, y = move[0]
+            halfmoves = 0 if board.is_capture(move) or isinstance(board.board[y][x], Pawn) else halfmoves + 1
+            moves.append(move_to_uci(move))
+            board.make_move(move)
+            seen[board.zobrist_key] = seen.get(board.zobrist_key, 0) + 1
+            if seen[board.zobrist_key] >= 3:
+                reason = 'repetition'
+                break
+    finally:
+        for ai in engines.values():
+            ai.close()
+    return {
+        'game': game,
+        'white': white[0],
+        'black': black[0],
+        'result': result,
+        'reason': reason,
+        'plies': len(moves),
+        'fen': fen,
+        'moves': moves,
+        'stats': {white[0]: stats['white'], black[0]: stats['black']},
+    }
+
+
+def schedule(engines, games_per_pair, fens, seed):
+    # Round robin; each opening is played twice with the colours swapped
+    games = []
+    for pair_index, (first, second) in enumerate(itertools.combinations(engines, 2)):
+        for round_index in range(games_per_pair):
+            opening_index = round_index // 2
+            fen = fens[opening_index % len(fens)]
+            opening = random_opening(f'{seed}-{pair_index}-{opening_index}', fen=fen)
+            white, black = (first, second) if round_index % 2 == 0 else (second, first)
+            games.append((len(games), white, black, fen, opening))
+    return games
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    # Elo difference from a score, with the bounds of its 95% confidence interval
+    games = wins + draws + losses
+    if not games:
+        return None
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = z * math.sqrt(variance / games)
+
+    def elo(value):
+        if value <= 0:
+            return -math.inf
+        if value >= 1:
+            return math.inf
+        return -400 * math.log10(1 / value - 1)
+    return elo(score), elo(score - margin), elo(score + margin)
+
+
+def summarize(records, names):
+    # Per engine: game counts and totals against the whole field
+    table = {name: {'wins': 0, 'draws': 0, 'losses': 0, 'moves': 0, 'time': 0.0, 'nodes': 0} for name in names}
+    for record in records:
+        for name, color in ((record['white'], 'white'), (record['black'], 'black')):
+            row = table[name]
+            if record['result'] == '1/2-1/2':
+                row['draws'] += 1
+            elif (record['result'] == '1-0') == (color == 'white'):
+                row['wins'] += 1
+            else:
+                row['losses'] += 1
+            stats = record['stats'][name]
+            row['moves'] += stats['moves']
+            row['time'] += stats['time']
+            row['nodes'] += stats['nodes']
+    return table
+
+
+def format_elo(value):
+    return f"{value:+.0f}" if math.isfinite(value) else ('+inf' if value > 0 else '-inf')
+
+
+def print_summary(records, names):
+    print(f"{'Engine':<16}{'Games':>6}{'W':>5}{'D':>5}{'L':>5}{'Score':>8}{'Elo':>7}  {'95% CI':<16}"
+          f"{'s/move':>8}{'nps':>9}")
+    for name, row in summarize(records, names).items():
+        games = row['wins'] + row['draws'] + row['losses']
+        if not games:
+            continue
+        elo, low, high = elo_interval(row['wins'], row['draws'], row['losses'])
+        per_move = row['time'] / row['moves'] if row['moves'] else 0.0
+        nps = row['nodes'] / row['time'] if row['time'] else 0.0
+        print(f"{name:<16}{games:>6}{row['wins']:>5}{row['draws']:>5}{row['losses']:>5}"
+              f"{100 * (row['wins'] + row['draws'] / 2) / games:>7.1f}%{format_elo(elo):>7}  "
+              f"{format_elo(low) + '..' + format_elo(high):<16}{per_move:>8.3f}{nps:>9.0f}")
+
+
+def run_tournament(engines, games_per_pair, output, processes=1, fens=(STARTING_FEN,), seed=0, max_plies=MAX_PLIES):
+    # Plays the schedule on a process pool and appends each finished game to the output JSONL file
+    games = schedule(engines, games_per_pair, list(fens), seed)
+    records = []
+    # Forked workers would otherwise share the random state that Easy moves and MCTS draw on
+    with open(output, 'a') as output_file, ProcessPoolExecutor(processes, initializer=random.seed) as executor:
+        futures = [executor.submit(play_game, *game, max_plies) for game in games]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            output_file.write(json.dumps(record) + '\n')
+            output_file.flush()
+            print(f"Game {record['game'] + 1}/{len(games)}: {record['white']} - {record['black']} "
+                  f"{record['result']} ({record['reason']}, {record['plies']} plies)")
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tournament', description="Play ChessAI configurations against each other.")
+    parser.add_argument('--engine', action='append', required=True,
+                        help="NAME:option=value,... with options " + ', '.join(ENGINE_OPTIONS))
+    parser.add_argument('--games', type=int, default=10, help="games per pair of engines")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="games played at once")
+    parser.add_argument('--output', default='tournament.jsonl', help="JSONL file the games are appended to")
+    parser.add_argument('--openings', help="file with one starting FEN per line")
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random opening moves")
+    parser.add_argument('--summary', action='store_true', help="only summarise the games already in --output")
+    args = parser.parse_args(argv)
+
+    engines = [parse_engine(text) for text in args.engine]
+    names = [name for name, _ in engines]
+    if len(set(names)) != len(names):
+        parser.error("engine names must be unique")
+
+    if args.summary:
+        with open(args.output) as output_file:
+            records = [json.loads(line) for line in output_file if line.strip()]
+        records = [record for record in records if record['white'] in names and record['black'] in names]
+    else:
+        fens = [STARTING_FEN]
+        if args.openings:
+            with open(args.openings) as openings_file:
+                fens = [line.strip() for line in openings_file if line.strip()]
+        start_time = time.perf_counter()
+        records = run_tournament(engines, args.games, args.output, args.processes, fens, args.seed, args.max_plies)
+        print(f"Time: {time.perf_counter() - start_time:.1f}s")
+    print_summary(records, names)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())